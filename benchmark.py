@@ -0,0 +1,581 @@
+#!/usr/bin/env python2
+"""
+Offline benchmark for analytics integration scanner.
+
+Runs the scanner against a local stand-in analytics server, over a
+synthetic /scanin tree of containers whose labels are read from image
+config files, i.e. without docker daemon or a real server.
+
+Reports containers/sec and p50/p95/p99 per container latency, and appends
+the results to a JSON lines file, comparing them with the last stored
+result of same benchmark parameters. Peak RSS is reported by --memory only.
+
+With --startup, measures the cold start of scanner instead, i.e. the time
+taken by a fresh interpreter to import the scanner and fail fast on missing
+inputs, along with the heavy modules it ended up importing.
+
+With --memory, runs every scan in a fresh scanner process and reports its
+peak RSS, e.g. against large synthetic reports of --response-size bytes.
+
+Usage:
+    python benchmark.py --containers 200 --workers 8 --latency 50
+    python benchmark.py --startup --runs 20
+    python benchmark.py --memory --response-size 20000000 --gzip
+"""
+
+from __future__ import print_function
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import integration
+
+
+def synthetic_report(size):
+    """
+    Returns a synthetic dependency analysis report of about size bytes of
+    JSON
+    """
+    dependencies = []
+    total = 0
+    while total < size:
+        i = len(dependencies)
+        dependency = {
+            "package": "package-%d" % i,
+            "version": "1.%d.%d" % (i % 100, i % 7),
+            "ecosystem": "pypi",
+            "license": "MIT",
+            "cves": ["CVE-2017-%04d" % (i % 10000)] if i % 5 == 0 else [],
+        }
+        total += len(json.dumps(dependency)) + 2
+        dependencies.append(dependency)
+    return {"dependencies": dependencies}
+
+
+class FakeAnalyticsServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for analytics server implementing /api/v1/register,
+    /api/v1/register/bulk, /api/v1/scanner-error and /api/v1/report APIs
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, error_rate=0.0, response_size=0,
+                 gzip=False, address=("127.0.0.1", 0)):
+        HTTPServer.__init__(self, address, FakeAnalyticsHandler)
+        # seconds to wait before responding
+        self.latency = latency
+        # fraction of requests answered with 503
+        self.error_rate = error_rate
+        # bytes of last_scan_report in register responses, 0 for none
+        self.response_size = response_size
+        self.report = (synthetic_report(response_size) if response_size
+                       else None)
+        # whether gzip compressed request and response bodies are
+        # supported, compressed requests are answered with 415 otherwise
+        self.gzip = gzip
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://%s:%d/" % self.server_address
+
+    def count(self, path, received=0, sent=0):
+        with self.lock:
+            if path is not None:
+                self.requests[path] = self.requests.get(path, 0) + 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def register_response(self, data):
+        resp = dict(data)
+        if self.report is not None:
+            resp["last_scan_report"] = self.report
+        return resp
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeAnalyticsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if (self.server.gzip and
+                "gzip" in (self.headers.get("Accept-Encoding") or "")):
+            body = integration.gzip_compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(None, sent=len(body))
+
+    def do_GET(self):
+        server = self.server
+        server.count(self.path.split("?")[0])
+        if server.latency:
+            time.sleep(server.latency)
+        if self.path.startswith("/api/v1/report"):
+            resp = {"status": "ok"}
+            if server.report is not None:
+                resp["last_scan_report"] = server.report
+            return self.send_json(200, resp)
+        return self.send_json(404, {"error": "Not Found"})
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        server.count(self.path, received=len(body))
+        if self.headers.get("Content-Encoding") == "gzip":
+            if not server.gzip:
+                return self.send_json(415, {"error": "Unsupported Media Type"})
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        data = json.loads(body.decode("utf-8") or "null")
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            return self.send_json(503, {"error": "Service Unavailable"})
+
+        if self.path == "/api/v1/register":
+            return self.send_json(200, server.register_response(data))
+        if self.path == "/api/v1/register/bulk":
+            return self.send_json(
+                200, [server.register_response(item) for item in data])
+        if self.path == "/api/v1/scanner-error":
+            return self.send_json(200, {"status": "recorded"})
+        return self.send_json(404, {"error": "Not Found"})
+
+
+def create_scanin_tree(path, containers):
+    """
+    Creates containers under path/scanin with image config files holding
+    their labels under path/configs, returns (scanin, configs) paths
+    """
+    scanin = os.path.join(path, "scanin")
+    configs = os.path.join(path, "configs")
+    os.makedirs(scanin)
+    os.makedirs(configs)
+    for i in range(containers):
+        uuid = "%064x" % random.getrandbits(256)
+        os.makedirs(os.path.join(scanin, uuid))
+        config = {
+            "config": {
+                "Labels": {
+                    "git-url": "https://github.com/example/repo-%d" % i,
+                    "git-sha": "%040x" % random.getrandbits(160),
+                    "email-ids": "dev-%d@example.com" % i,
+                }
+            }
+        }
+        with open(os.path.join(configs, uuid + ".json"), "w") as f:
+            json.dump(config, f)
+    return scanin, configs
+
+
+def percentile(values, percent):
+    """
+    Returns the percent-th percentile of values, nearest rank method
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def git_version():
+    """
+    Returns git sha of the scanner code benchmarked, "unknown" if not
+    available
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_scan(scan_type):
+    """
+    Runs the scanner over the containers in integration.INDIR the same way
+    Scanner.run does, returns (wall clock seconds, per container latencies,
+    number of successful scans)
+    """
+    scanner = integration.Scanner(scan_type=scan_type)
+    containers = scanner.target_containers()
+    latencies = []
+    successful = 0
+    start = integration.monotonic_time()
+    for container, status, output, latency in scanner.scan_containers(
+            containers):
+        latencies.append(latency)
+        successful += int(bool(status))
+        scanner.export_results(os.path.join(integration.OUTDIR, container),
+                               output, container)
+    return integration.monotonic_time() - start, latencies, successful
+
+
+def benchmark(args):
+    """
+    Runs the benchmark as per parsed command line args, returns results
+    """
+    server = FakeAnalyticsServer(latency=args.latency / 1000.0,
+                                 error_rate=args.error_rate,
+                                 response_size=args.response_size,
+                                 gzip=args.gzip).start()
+    workdir = tempfile.mkdtemp(prefix="scanner-benchmark-")
+    try:
+        scanin, configs = create_scanin_tree(workdir, args.containers)
+        os.environ.update(scanner_env(args, server, configs))
+        integration.INDIR = scanin
+
+        runs = []
+        for _ in range(args.runs):
+            integration.OUTDIR = tempfile.mkdtemp(dir=workdir)
+            # start every run with a closed circuit breaker
+            integration._circuit_breakers.clear()
+            runs.append(run_scan(args.scan_type))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir)
+
+    elapsed = sum(run[0] for run in runs)
+    latencies = [latency for run in runs for latency in run[1]]
+    scanned = args.containers * args.runs
+    return {
+        "version": git_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "params": benchmark_params(args),
+        "containers_per_sec": round(scanned / elapsed, 3) if elapsed else 0,
+        "successful": sum(run[2] for run in runs),
+        "latency_p50": round(percentile(latencies, 50), 6),
+        "latency_p95": round(percentile(latencies, 95), 6),
+        "latency_p99": round(percentile(latencies, 99), 6),
+        "server_requests": server.requests,
+        "server_bytes": {"received": server.bytes_received,
+                         "sent": server.bytes_sent},
+    }
+
+
+def scanner_env(args, server, configs):
+    """
+    Returns the env variables to run scanner with as per parsed command
+    line args, against server and image configs in configs directory
+    """
+    env = {
+        "IMAGE_NAME": "benchmark/image",
+        "SERVER": server.url,
+        "LABEL_SOURCES": "config",
+        "IMAGE_CONFIG_DIR": configs,
+        "SCAN_WORKERS": str(args.workers),
+        "REGISTER_BATCH_SIZE": str(args.batch_size),
+    }
+    if args.gzip:
+        env["REQUEST_COMPRESSION"] = "gzip"
+    return env
+
+
+def benchmark_params(args, mode=None):
+    """
+    Returns the benchmark params of parsed command line args, results are
+    compared with previous results of same params
+    """
+    params = {
+        "scan_type": args.scan_type,
+        "containers": args.containers,
+        "runs": args.runs,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "latency_ms": args.latency,
+        "error_rate": args.error_rate,
+        "response_size": args.response_size,
+    }
+    if args.gzip:
+        params["gzip"] = True
+    if mode is not None:
+        params["mode"] = mode
+    return params
+
+
+# run in a fresh interpreter, scans the containers in given /scanin
+# directory into given /scanout directory
+MEMORY_CODE = """
+import sys
+import integration
+integration.INDIR, integration.OUTDIR = sys.argv[1], sys.argv[2]
+integration.Scanner(scan_type=sys.argv[3]).run()
+"""
+
+
+def run_scanner_process(scanin, scanout, scan_type, env):
+    """
+    Runs the scanner in a fresh process, returns (wall clock seconds, peak
+    RSS of scanner process in KB)
+    """
+    command = [sys.executable, "-c", MEMORY_CODE, scanin, scanout, scan_type]
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        process = subprocess.Popen(
+            command, env=env, stdout=devnull, stderr=devnull,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        # rusage of this very process, RUSAGE_CHILDREN would be the maximum
+        # over all the children waited for
+        _, status, rusage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+    process.returncode = status
+    if status != 0:
+        raise RuntimeError("Scanner process failed with status %d" % status)
+    rss = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        rss = rss // 1024
+    return elapsed, rss
+
+
+def memory_benchmark(args):
+    """
+    Runs the memory benchmark as per parsed command line args, returns
+    results
+    """
+    server = FakeAnalyticsServer(latency=args.latency / 1000.0,
+                                 error_rate=args.error_rate,
+                                 response_size=args.response_size,
+                                 gzip=args.gzip).start()
+    workdir = tempfile.mkdtemp(prefix="scanner-benchmark-")
+    try:
+        scanin, configs = create_scanin_tree(workdir, args.containers)
+        env = dict(os.environ)
+        env.update(scanner_env(args, server, configs))
+        runs = []
+        for _ in range(args.runs):
+            scanout = tempfile.mkdtemp(dir=workdir)
+            runs.append(run_scanner_process(scanin, scanout, args.scan_type,
+                                            env))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir)
+
+    wall_times = [run[0] for run in runs]
+    peaks = [run[1] for run in runs]
+    return {
+        "version": git_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "params": benchmark_params(args, mode="memory"),
+        "scanner_wall_p50": round(percentile(wall_times, 50), 6),
+        "scanner_peak_rss_kb": max(peaks),
+        "server_requests": server.requests,
+        "server_bytes": {"received": server.bytes_received,
+                         "sent": server.bytes_sent},
+    }
+
+
+# modules the scanner should not import before a phase needs them
+HEAVY_MODULES = ("docker", "requests", "sqlite3", "tarfile", "subprocess",
+                 "multiprocessing", "email.utils")
+
+# run in a fresh interpreter, imports scanner and runs a scan failing fast
+# on missing IMAGE_NAME and SERVER env variables
+STARTUP_CODE = """
+import json, sys, time
+start = time.time()
+import integration
+integration.AnalyticsIntegration("xstartup", "register").run()
+elapsed = time.time() - start
+print(json.dumps({"seconds": elapsed, "modules": [
+    m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr):
+    """
+    Returns cumulative microseconds spent importing integration module as
+    per `python -X importtime` output, None if not available
+    """
+    for line in stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == "integration":
+            return int(parts[1])
+    return None
+
+
+def startup_benchmark(args):
+    """
+    Runs the cold start benchmark as per parsed command line args, returns
+    results
+    """
+    command = [sys.executable]
+    if sys.version_info >= (3, 7):
+        command += ["-X", "importtime"]
+    command += ["-c", STARTUP_CODE]
+    env = dict(os.environ)
+    env.pop("IMAGE_NAME", None)
+    env.pop("SERVER", None)
+
+    wall_times, scan_times, import_times = [], [], []
+    modules = set()
+    for _ in range(args.runs):
+        start = time.time()
+        process = subprocess.Popen(
+            command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        stdout, stderr = process.communicate()
+        wall_times.append(time.time() - start)
+        if process.returncode != 0:
+            raise RuntimeError("Scanner cold start failed: %s" %
+                               stderr.decode("utf-8"))
+        out = json.loads(stdout.decode("utf-8").strip().splitlines()[-1])
+        scan_times.append(out["seconds"])
+        modules.update(out["modules"])
+        import_time = parse_importtime(stderr.decode("utf-8"))
+        if import_time is not None:
+            import_times.append(import_time)
+
+    return {
+        "version": git_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "params": {"mode": "startup", "runs": args.runs},
+        "startup_wall_p50": round(percentile(wall_times, 50), 6),
+        "startup_scan_p50": round(percentile(scan_times, 50), 6),
+        "importtime_us_p50": (int(percentile(import_times, 50))
+                              if import_times else None),
+        "heavy_modules": sorted(modules),
+    }
+
+
+def last_result(path, params):
+    """
+    Returns the last stored result in path for same benchmark params
+    """
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            result = json.loads(line)
+            if result.get("params") == params:
+                previous = result
+    return previous
+
+
+def report(result, previous):
+    print("Benchmark of %s (python %s)" % (
+        result["version"], result["python"]))
+    print("  params: %s" % json.dumps(result["params"], sort_keys=True))
+    for key, fmt in (("containers_per_sec", "%.3f"),
+                     ("latency_p50", "%.6f"),
+                     ("latency_p95", "%.6f"),
+                     ("latency_p99", "%.6f"),
+                     ("scanner_wall_p50", "%.6f"),
+                     ("scanner_peak_rss_kb", "%d"),
+                     ("startup_wall_p50", "%.6f"),
+                     ("startup_scan_p50", "%.6f"),
+                     ("importtime_us_p50", "%d")):
+        if result.get(key) is None:
+            continue
+        line = ("  %-20s " + fmt) % (key, result[key])
+        if previous is not None and previous.get(key):
+            change = (result[key] - previous[key]) * 100.0 / previous[key]
+            line += "  (%+.1f%% vs %s)" % (change, previous["version"])
+        print(line)
+    if "successful" in result:
+        print("  successful scans     %d" % result["successful"])
+    if "server_requests" in result:
+        print("  server requests      %s" % json.dumps(
+            result["server_requests"], sort_keys=True))
+        print("  server bytes         %s" % json.dumps(
+            result["server_bytes"], sort_keys=True))
+    if "heavy_modules" in result:
+        print("  heavy modules        %s" % (
+            ", ".join(result["heavy_modules"]) or "none"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark analytics integration scanner against a "
+                    "local stand-in analytics server.")
+    parser.add_argument("--containers", type=int, default=100,
+                        help="number of containers in synthetic /scanin")
+    parser.add_argument("--runs", type=int, default=1,
+                        help="number of scanner runs over the containers")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="SCAN_WORKERS for the scanner")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="REGISTER_BATCH_SIZE for the scanner")
+    parser.add_argument("--scan-type", default="register",
+                        help="scan type to run scanner with")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="milliseconds server waits before responding")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of server responses being 503")
+    parser.add_argument("--response-size", type=int, default=0,
+                        help="bytes of last_scan_report in server responses")
+    parser.add_argument("--gzip", action="store_true",
+                        help="gzip compress request and response bodies")
+    parser.add_argument("--memory", action="store_true",
+                        help="benchmark peak RSS of scanner process instead, "
+                             "running a fresh process --runs times")
+    parser.add_argument("--startup", action="store_true",
+                        help="benchmark cold start of scanner instead, "
+                             "--runs times")
+    parser.add_argument("--output", default="benchmark_results.jsonl",
+                        help="JSON lines file to append results to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup:
+        result = startup_benchmark(args)
+    elif args.memory:
+        result = memory_benchmark(args)
+    else:
+        result = benchmark(args)
+    previous = last_result(args.output, result["params"])
+    report(result, previous)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,370 @@
 #!/usr/bin/env python2
 
-from Atomic import run as atomic_run
-
-from requests.compat import urljoin
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
-import docker
+try:
+    import Queue as queue
+    import SocketServer as socketserver
+    from urlparse import urljoin
+except ImportError:
+    import queue
+    import socketserver
+    from urllib.parse import urljoin
+
+import functools
 import json
 import logging
 import os
-import requests
-import subprocess
+import random
+import socket
 import sys
+import threading
+import time
+
+# heavy dependencies, i.e. docker, requests, sqlite3 and others not needed
+# by every scan, are imported by the functions using them, so that the
+# scanner starts fast and fails fast on missing inputs
 
 
 OUTDIR = "/scanout"
 INDIR = "/scanin"
 
 
+def get_monotonic_clock():
+    """
+    Returns a monotonic clock function, in seconds.
+
+    time.monotonic is not available on python2, where clock_gettime of libc
+    is called with CLOCK_MONOTONIC on linux, and os.times elapsed time
+    (monotonic, but of clock tick resolution, usually 10ms) is used
+    elsewhere.
+    """
+    monotonic = getattr(time, "monotonic", None)
+    if monotonic is not None:
+        return monotonic
+    try:
+        if not sys.platform.startswith("linux"):
+            raise OSError("clock_gettime is only used on linux")
+        import ctypes
+
+        class timespec(ctypes.Structure):
+            _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+        # clock_gettime is in libc since glibc 2.17, in librt before
+        try:
+            clock_gettime = ctypes.CDLL("libc.so.6").clock_gettime
+        except AttributeError:
+            clock_gettime = ctypes.CDLL("librt.so.1").clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        clock_monotonic = 1
+
+        def monotonic():
+            t = timespec()
+            if clock_gettime(clock_monotonic, ctypes.byref(t)) != 0:
+                raise OSError("clock_gettime(CLOCK_MONOTONIC) failed")
+            return t.tv_sec + t.tv_nsec * 1e-9
+
+        monotonic()
+        return monotonic
+    except (OSError, ImportError):
+        return lambda: os.times()[4]
+
+
+monotonic_time = get_monotonic_clock()
+
+
+class PhaseTimings(object):
+    """
+    Monotonic timings of the phases of a container scan, in seconds
+    """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager timing the code run in it as phase name
+        """
+        start = monotonic_time()
+        try:
+            yield
+        finally:
+            self.add(name, monotonic_time() - start)
+
+    def to_dict(self):
+        return OrderedDict(
+            (name, round(seconds, 6)) for name, seconds in
+            self.timings.items())
+
+
 class EmptyLabelException(Exception):
 
     def __init__(self, message):
         super(EmptyLabelException, self).__init__(message)
 
 
+# fields added to log records of current thread, see log_context
+_log_context = threading.local()
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Adds given fields, e.g. container and image, to the log records
+    emitted by current thread within the context
+    """
+    previous = getattr(_log_context, "fields", {})
+    current = dict(previous)
+    current.update(fields)
+    _log_context.fields = current
+    try:
+        yield
+    finally:
+        _log_context.fields = previous
+
+
+def scan_log_context(method):
+    """
+    Decorates the method of AnalyticsIntegration to log in the context of
+    its container and image
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with log_context(container=self.container, image=self.image_name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class LogContextFilter(logging.Filter):
+    """
+    Adds the log context fields of emitting thread to log records
+    """
+
+    def filter(self, record):
+        record.context = getattr(_log_context, "fields", {})
+        return True
+
+
+class LogSamplingFilter(logging.Filter):
+    """
+    Passes only rates[level] fraction of the log records of each level,
+    e.g. to keep a sample of high volume debug records
+    """
+
+    def __init__(self, rates):
+        logging.Filter.__init__(self)
+        self.rates = rates
+        self.dropped = 0
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class QueueHandler(logging.Handler):
+    """
+    Puts the log records on a queue without blocking, for QueueListener to
+    write them out. Records are dropped while the queue is full.
+
+    logging.handlers.QueueHandler is not available on python2.
+    """
+
+    def __init__(self, records):
+        logging.Handler.__init__(self)
+        self.records = records
+        self.dropped = 0
+
+    def emit(self, record):
+        try:
+            # format the message and traceback in emitting thread, as
+            # message arguments may change by the time record is written
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info)
+                record.exc_info = None
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """
+    Writes the log records put on queue by QueueHandler to handlers, on a
+    background thread
+    """
+
+    def __init__(self, records, handlers):
+        self.records = records
+        self.handlers = handlers
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self, timeout=5):
+        """
+        Write out the queued records and stop the listener thread
+        """
+        if self.thread is None:
+            return
+        self.records.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+
+class JSONLogFormatter(logging.Formatter):
+    """
+    Formats log records as one line JSON objects, with the log context
+    fields of record
+    """
+
+    def format(self, record):
+        entry = OrderedDict([
+            ("time", self.formatTime(record)),
+            ("level", record.levelname),
+            ("logger", record.name),
+            ("process", record.process),
+            ("message", record.getMessage()),
+        ])
+        entry.update(getattr(record, "context", {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+def get_log_level(env_name="LOG_LEVEL"):
+    """
+    Gets the level of logged records, defaults to DEBUG
+    """
+    value = os.environ.get(env_name, "").strip().upper() or "DEBUG"
+    level = logging.getLevelName(value)
+    if not isinstance(level, int):
+        logging.getLogger("integration-scanner").warning(
+            "Invalid value %s for %s env variable, using DEBUG.",
+            value, env_name)
+        return logging.DEBUG
+    return level
+
+
+def get_log_stream(env_name="LOG_STREAM"):
+    """
+    Gets the stream log records are written to, stdout by default. Records
+    are written to stderr if asked to, or if NDJSON results are written to
+    stdout, so that stdout carries the NDJSON records alone.
+    """
+    if os.environ.get(env_name, "").strip() == "stderr":
+        return sys.stderr
+    if (os.environ.get("RESULTS_OUTPUT", "").strip() in ("ndjson", "both") and
+            get_results_ndjson_path() == "-"):
+        return sys.stderr
+    return sys.stdout
+
+
+def get_log_sample_rates(prefix="LOG_SAMPLE_"):
+    """
+    Gets the fraction of log records logged per level from LOG_SAMPLE_DEBUG,
+    LOG_SAMPLE_INFO, LOG_SAMPLE_WARNING and LOG_SAMPLE_ERROR env variables,
+    all records are logged by default
+    """
+    rates = {}
+    for name in ("DEBUG", "INFO", "WARNING", "ERROR"):
+        rate = get_env_float(prefix + name, default=1.0)
+        rates[logging.getLevelName(name)] = min(max(rate, 0.0), 1.0)
+    return rates
+
+
+# name of configured logger -> (QueueHandler, QueueListener)
+_log_handlers = {}
+_log_handlers_lock = threading.Lock()
+
+
 def configure_logging(name="integration-scanner"):
     """
-    Configures logging and returns logger object
+    Configures logging and returns logger object.
+
+    Records are put on a queue by the emitting threads and written out by
+    a background listener thread, so that scans never block on writing
+    logs. Configuring an already configured logger only returns it.
     """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(
-        "%(asctime)s %(levelname)s p%(process)s %(name)s %(lineno)d "
-        "%(levelname)s - %(message)s"
-    )
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    with _log_handlers_lock:
+        if name in _log_handlers:
+            return logger
+        level = get_log_level()
+        logger.setLevel(level)
+        ch = logging.StreamHandler(get_log_stream())
+        ch.setLevel(level)
+        if os.environ.get("LOG_FORMAT", "").strip() == "json":
+            formatter = JSONLogFormatter()
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s %(levelname)s p%(process)s %(name)s "
+                "%(lineno)d %(levelname)s - %(message)s"
+            )
+        ch.setFormatter(formatter)
+
+        records = queue.Queue(get_env_int("LOG_QUEUE_SIZE", default=10000,
+                                          minimum=1))
+        handler = QueueHandler(records)
+        handler.addFilter(LogSamplingFilter(get_log_sample_rates()))
+        handler.addFilter(LogContextFilter())
+        logger.addHandler(handler)
+        listener = QueueListener(records, [ch])
+        listener.start()
+        _log_handlers[name] = (handler, listener)
+
+        import atexit
+        atexit.register(listener.stop)
     return logger
 
 
+def reset_logging():
+    """
+    Removes the handlers added by configure_logging, e.g. in a forked
+    process which does not run the listener threads of its parent.
+
+    :return: Names of the loggers which were configured
+    """
+    with _log_handlers_lock:
+        names = list(_log_handlers)
+        for name in names:
+            handler, _ = _log_handlers.pop(name)
+            logging.getLogger(name).removeHandler(handler)
+    return names
+
+
 def get_server_url(env_name="SERVER"):
     """
-    Gets the SERVER env variable value
+    Gets the SERVER env variable value, a server URL or comma separated
+    URLs of server replicas
     """
-    if not os.environ.get("SERVER", False):
+    if not os.environ.get("SERVER", "").replace(",", "").strip():
         raise ValueError(
             "No value for SERVER env variable. Please re-run with: "
             "SERVER=<url> IMAGE_NAME=<image> atomic scan [..]")
@@ -64,10 +383,55 @@ def get_image_name(env_name="IMAGE_NAME"):
     return os.environ.get("IMAGE_NAME")
 
 
+def get_env_int(env_name, default, minimum=None):
+    """
+    Gets the integer value of given env variable, returns default if the
+    variable is not set or holds an invalid value
+    """
+    value = os.environ.get(env_name, "").strip()
+    if not value:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        logging.getLogger("integration-scanner").warning(
+            "Invalid value %r for %s env variable, using default %s.",
+            value, env_name, default)
+        return default
+    if minimum is not None and value < minimum:
+        return minimum
+    return value
+
+
+def get_env_float(env_name, default):
+    """
+    Gets the float value of given env variable, returns default if the
+    variable is not set or holds an invalid value
+    """
+    value = os.environ.get(env_name, "").strip()
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logging.getLogger("integration-scanner").warning(
+            "Invalid value %r for %s env variable, using default %s.",
+            value, env_name, default)
+        return default
+
+
+def get_scan_workers(env_name="SCAN_WORKERS"):
+    """
+    Gets the number of containers to be scanned concurrently
+    """
+    return get_env_int(env_name, default=1, minimum=1)
+
+
 def connect_local_docker_socket(base_url="unix:///var/run/docker.sock"):
     """
     Initiates local docker client connection
     """
+    import docker
     client = docker.Client(base_url=base_url)
     return client
 
@@ -79,11 +443,259 @@ def get_image_uuid(client, image_name):
     return client.inspect_image(image_name)["Id"].split(":")[-1]
 
 
-def find_label(run_object, image, label):
+def get_image_labels(client, image_name):
+    """
+    Using passed docker client object, returns (image uuid, labels dict)
+    for image_name with a single inspect call.
+    """
+    inspect = client.inspect_image(image_name)
+    labels = (inspect.get("Config") or {}).get("Labels") or {}
+    return inspect["Id"].split(":")[-1], labels
+
+
+class ImageLabelCache(object):
+    """
+    Memoizes the labels of images by image uuid, so that containers
+    sharing an image inspect it only once per run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # image uuid -> labels dict
+        self.labels = {}
+        # image name -> image uuid
+        self.uuids = {}
+
+    def get(self, client, image_name):
+        """
+        Returns (image uuid, labels dict) for image_name, inspects the image
+        using passed docker client object if not already cached
+        """
+        with self.lock:
+            uuid = self.uuids.get(image_name)
+            if uuid is not None:
+                return uuid, self.labels[uuid]
+
+        uuid, labels = get_image_labels(client, image_name)
+        with self.lock:
+            self.uuids[image_name] = uuid
+            self.labels[uuid] = labels
+        return uuid, labels
+
+
+def get_label_sources(env_name="LABEL_SOURCES"):
+    """
+    Gets the ordered list of label source names to look up labels with
+    """
+    value = os.environ.get(env_name, "").strip() or "config,daemon"
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def get_image_config_dir(env_name="IMAGE_CONFIG_DIR"):
+    """
+    Gets the directory holding image config JSON files or image tarballs,
+    None if not configured
+    """
+    return os.environ.get(env_name, "").strip() or None
+
+
+def labels_from_image_config(config):
+    """
+    Returns the labels dict from given image config JSON data
+    """
+    # image config JSON has lower case `config` key, inspect output has
+    # `Config` key, support both
+    container_config = config.get("config") or config.get("Config") or {}
+    return container_config.get("Labels") or {}
+
+
+class DaemonLabelSource(object):
+    """
+    Reads image labels by inspecting the image via local docker daemon
+    """
+    name = "daemon"
+
+    def __init__(self, base_url="unix:///var/run/docker.sock"):
+        self.base_url = base_url
+        self.client = None
+        self.lock = threading.Lock()
+        self.image_label_cache = ImageLabelCache()
+
+    def get_client(self):
+        """
+        Returns docker client, connects on first call
+        """
+        with self.lock:
+            if self.client is None:
+                self.client = connect_local_docker_socket(self.base_url)
+            return self.client
+
+    def get_labels(self, image_name, container, timings=None):
+        """
+        Returns (image uuid, labels dict) for image_name
+        """
+        timings = timings or PhaseTimings()
+        with timings.phase("docker_connect"):
+            client = self.get_client()
+        return self.image_label_cache.get(client, image_name)
+
+
+class ImageConfigLabelSource(object):
+    """
+    Reads image labels from image config JSON, without docker daemon.
+
+    The image config is looked up for container (image uuid) as
+     - <config_dir>/<container>.json, an image config JSON file
+     - <config_dir>/<container>.tar, an image tarball from `docker save`
+     - <indir>/<container>/manifest.json, a mounted `docker save` layout
+    """
+    name = "config"
+
+    def __init__(self, config_dir=None, indir=None):
+        self.config_dir = config_dir
+        self.indir = indir or INDIR
+
+    def get_labels(self, image_name, container, timings=None):
+        """
+        Returns (image uuid, labels dict) for container, None if no image
+        config is available for container, or it is not a valid image
+        config, so that the next label source is tried
+        """
+        if not container:
+            return None
+
+        labels = None
+        try:
+            if self.config_dir:
+                config_path = os.path.join(self.config_dir,
+                                           container + ".json")
+                tarball_path = os.path.join(self.config_dir,
+                                            container + ".tar")
+                if os.path.isfile(config_path):
+                    labels = self.labels_from_file(config_path)
+                elif os.path.isfile(tarball_path):
+                    labels = self.labels_from_tarball(tarball_path)
+
+            if labels is None:
+                labels = self.labels_from_layout(
+                    os.path.join(self.indir, container))
+        except (KeyError, IndexError, TypeError, AttributeError, ValueError,
+                IOError, OSError) as e:
+            # e.g. a /manifest.json of the image rootfs, not a layout
+            logging.getLogger("integration-scanner").debug(
+                "Could not read image config of %s: %s", container, e)
+            return None
+
+        if labels is None:
+            return None
+        return container, labels
+
+    def labels_from_file(self, config_path):
+        """
+        Returns the labels dict from image config JSON file
+        """
+        with open(config_path, "rb") as f:
+            return labels_from_image_config(json.load(f))
+
+    def labels_from_layout(self, layout_dir):
+        """
+        Returns the labels dict from image config in mounted `docker save`
+        layout, None if layout_dir has no manifest.json
+
+        :raises: ValueError if image config path in manifest is outside of
+                 layout_dir
+        """
+        manifest_path = os.path.join(layout_dir, "manifest.json")
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, "rb") as f:
+            manifest = json.load(f)
+        root = os.path.realpath(layout_dir)
+        config_path = os.path.realpath(
+            os.path.join(root, manifest[0]["Config"]))
+        if not config_path.startswith(root + os.sep):
+            raise ValueError("Image config path %s is outside of %s." % (
+                manifest[0]["Config"], layout_dir))
+        return self.labels_from_file(config_path)
+
+    def labels_from_tarball(self, tarball_path):
+        """
+        Returns the labels dict from image config in `docker save` tarball,
+        reading only the manifest and config members of tarball
+        """
+        import tarfile
+        try:
+            tarball = tarfile.open(tarball_path, "r")
+        except tarfile.TarError as e:
+            raise ValueError(str(e))
+        try:
+            manifest = json.load(tarball.extractfile("manifest.json"))
+            config = json.load(tarball.extractfile(manifest[0]["Config"]))
+        finally:
+            tarball.close()
+        return labels_from_image_config(config)
+
+
+class LabelSource(object):
+    """
+    Looks up image labels with given label sources, in order, until one of
+    them has the labels of image
+    """
+
+    source_types = {
+        "config": lambda: ImageConfigLabelSource(
+            config_dir=get_image_config_dir()),
+        "daemon": DaemonLabelSource,
+    }
+
+    def __init__(self, sources):
+        self.sources = sources
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns LabelSource with label sources configured in env variables
+        """
+        sources = []
+        for name in get_label_sources():
+            if name not in cls.source_types:
+                raise ValueError(
+                    "Invalid label source %s in LABEL_SOURCES env variable, "
+                    "valid values are: %s" % (
+                        name, ", ".join(sorted(cls.source_types))))
+            sources.append(cls.source_types[name]())
+        return cls(sources)
+
+    def get_labels(self, image_name, container, timings=None):
+        """
+        Returns (image uuid, labels dict) for image_name under test mounted
+        as container, times every label source tried in timings
+        """
+        timings = timings or PhaseTimings()
+        for source in self.sources:
+            with timings.phase("label_source." + source.name):
+                result = source.get_labels(image_name, container, timings)
+            if result is not None:
+                return result
+        raise ValueError(
+            "Could not find labels of image %s with label sources: %s" % (
+                image_name, ", ".join(s.name for s in self.sources)))
+
+
+def label_fingerprint(labels):
+    """
+    Returns a hash of given labels dict, same for same labels and values
+    """
+    import hashlib
+    canonical = json.dumps(labels, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def find_label(labels, image, label):
     """
-    For given image, return the value for label
+    For given labels dict of image, return the value for label
     """
-    label_value = run_object.get_label(label)
+    label_value = labels.get(label)
     if not label_value:
         raise EmptyLabelException(
             "Image %s does not have %s label configured." % (image, label)
@@ -104,163 +716,1772 @@ def run_command(cmd, shell=True):
     :rtype: str
     :raises: subprocess.CalledProcessError
     """
+    import subprocess
     if shell:
         return subprocess.check_output(cmd, shell=True)
     else:
         return subprocess.check_output(cmd.split(), shell=False)
 
 
-def post_request(endpoint, api, data):
+# shared HTTP session for all the calls made to analytics server
+_http_session = None
+_http_session_pool_size = 0
+_http_session_lock = threading.Lock()
+
+
+def get_server_pool_size(env_name="SERVER_POOL_SIZE"):
+    """
+    Gets the number of keep-alive connections to keep per server host
     """
-    Make a post call to analytics server with given data
+    return get_env_int(env_name, default=10, minimum=1)
 
-    :param endpoint: API server end point
-    :param api: API to make POST call against
-    :param data: JSON data needed for POST call to api endpoint
 
-    :return: Tuple (status, error_if_any)
-             where status = True/False
-                   error_if_any = string message on error, "" on success
+def get_server_timeout(connect_env_name="SERVER_CONNECT_TIMEOUT",
+                       read_env_name="SERVER_READ_TIMEOUT"):
     """
-    url = urljoin(endpoint, api)
-    # TODO: check if we need API key in data
-    try:
-        r = requests.post(
-            url,
-            json.dumps(data),
-            headers={"Content-Type": "application/json"})
-    except requests.exceptions.RequestException as e:
-        error = ("Could not send POST request to URL {0}, "
-                 "with data: {1}.").format(url, str(data))
-        return False, error + " Error: " + str(e)
-    else:
-        if r.status_code == requests.codes.ok:
-            return True, json.loads(r.text)
-        else:
-            return True, "Returned non okay status code on POST request."
+    Gets the (connect, read) timeouts in seconds for server calls
+    """
+    return (get_env_float(connect_env_name, default=5.0),
+            get_env_float(read_env_name, default=60.0))
 
 
-def get_request(endpoint, api):
+def get_http_session(pool_size=None):
     """
-    Make a get call to analytics server
+    Returns the HTTP session shared by all the calls to analytics server,
+    creates it on first call.
 
-    :param endpoint: API server end point
-    :param api: API to make GET call against
+    The session keeps connections to server alive and pools them, so that
+    subsequent calls do not pay for a new TCP and TLS handshake.
 
-    :return: The data received from get call
+    :param pool_size: Optional number of concurrent server calls to pool
+                      connections for, the pools are enlarged to it if
+                      smaller. Connections of calls beyond pool size are
+                      discarded instead of kept alive.
+    """
+    global _http_session, _http_session_pool_size
+    import requests
+    with _http_session_lock:
+        pool_size = max(pool_size or 0, get_server_pool_size())
+        if _http_session is None:
+            _http_session = requests.Session()
+        if pool_size > _http_session_pool_size:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size)
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+            _http_session_pool_size = pool_size
+        return _http_session
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a server call is not made as the circuit breaker for
+    server is open
     """
     pass
 
 
-class AnalyticsIntegration(object):
+class CircuitBreaker(object):
     """
-    Analytics integrtion related tasks wrapped in this calls
+    Circuit breaker for calls to a server.
+
+    After failure_threshold consecutive failed calls, the breaker opens and
+    calls are short-circuited for reset_timeout seconds. Then a single trial
+    call is let through (half open), its success closes the breaker again,
+    its failure re-opens it.
     """
 
-    def __init__(self, container, scan_type):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
         """
-        Initialize object variables specific to per container scanning
+        Returns True if a call to server should be made
         """
-        self.scanner = "scanner-analytics-integration"
-        self.container = container
-        # scan_type = [register, scan, get_report]
-        self.scan_type = scan_type
-        self.run_object = atomic_run.Run()
-        # following are the labels must be present in image
-        self.needed_labels_names = ["git-url", "git-sha", "email-ids"]
-        # following three variables need to be processed later
-        self.label_data = None
-        self.image_name = None
-        self.server_url = None
-        # This will contain the result/error data
-        self.respone = None
-        self.errors = []
-        self.failure = True
-        # the labels needed for calling server APIs
-        self.recorded_labels = {}
-        # the needed data to be logged in scanner output
-        self.data = {}
-        # the templated data this scanner will export
-        self.json_out = self.template_json_data(self.scanner,
-                                                self.scan_type,
-                                                container[1:])
-
-    def template_json_data(self, scanner, scan_type, uuid):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    monotonic_time() - self.opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def is_open(self):
         """
-        Populate and return a template standard json data out for scanner.
+        Returns True while calls are short-circuited, without letting a
+        trial call through
         """
-        current_time = datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
-        json_out = {
-            "Start Time": current_time,
-            "Successful": False,
-            "Scan Type": scan_type,
-            "UUID": uuid,
-            "CVE Feed Last Updated": "NA",
-            "Scanner": scanner,
-            "Scan Results": {},
-            "Summary": ""
-        }
-        return json_out
+        with self.lock:
+            return (self.state == self.OPEN and
+                    monotonic_time() - self.opened_at < self.reset_timeout)
 
-    def record_fatal_error(self, error):
-        self.errors.append(str(error))
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
 
-    def record_label(self, name, value):
-        self.recorded_labels[name] = value.strip()
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = monotonic_time()
+                self.trial_in_flight = False
 
-    def post_scanner_error(self):
-        """
-        Upon issues with input data to scanner, invoke /scanner-error POST API
-        """
-        # in case of SERVER env var is not give, we wont be able to even
-        # post the error to /scanner-error APIs
-        if not self.server_url:
-            msg = ("Can't report errors via /scanner-error API, "
-                   "as SERVER URL is not given in scanner command.")
-            return False, msg
 
-        post_data = {
-            "image-name": self.data.get("image_name", ""),
-            "email-ids": self.recorded_labels.get("email-ids", ""),
-            "error": self.errors,
-        }
+# circuit breakers per server end point
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
 
-        api = "/api/v1/scanner-error"
 
-        status, out = post_request(endpoint=self.server_url,
-                                   api=api,
-                                   data=post_data)
-        if not status:
-            return status, out
-        else:
-            return True, "Reported errors via /scanner-error POST API."
+def get_circuit_breaker(endpoint):
+    """
+    Returns the circuit breaker for given server end point
+    """
+    with _circuit_breakers_lock:
+        if endpoint not in _circuit_breakers:
+            _circuit_breakers[endpoint] = CircuitBreaker(
+                failure_threshold=get_env_int("BREAKER_THRESHOLD",
+                                              default=5, minimum=1),
+                reset_timeout=get_env_float("BREAKER_RESET_TIMEOUT",
+                                            default=30.0))
+        return _circuit_breakers[endpoint]
 
-    def return_on_failure(self):
-        if self.failure:
-            # report errors on analytics server before returning the scanner
-            status, out = self.post_scanner_error()
+
+def parse_server_urls(server_url):
+    """
+    Returns the list of server end points in comma separated server_url
+    """
+    return [url.strip() for url in server_url.split(",") if url.strip()]
+
+
+def routing_key(data):
+    """
+    Returns the key to route the server call with given payload or query
+    parameters by, i.e. git-url of the repository
+    """
+    if isinstance(data, dict):
+        return data.get("git-url") or data.get("image-name") or ""
+    return ""
+
+
+class ServerRing(object):
+    """
+    Replicas of analytics server given as comma separated SERVER list.
+
+    Calls are routed by consistent hashing of their routing key (git-url)
+    onto a ring of the end points, so that the calls for a repository go to
+    the same replica and its caches stay warm. The following end points on
+    ring are the failover candidates.
+
+    End points are routed around while their circuit breaker is open, while
+    they failed the last active health check, or for slow_cooldown seconds
+    after their latency (exponentially weighted moving average) went over
+    slow_latency seconds. Such end points are tried last.
+    """
+
+    # weight of latest call in moving average of latency
+    latency_weight = 0.2
+
+    def __init__(self, endpoints, replicas=100, slow_latency=5.0,
+                 slow_cooldown=30.0):
+        import bisect
+        import hashlib
+        self.endpoints = endpoints
+        self.slow_latency = slow_latency
+        self.slow_cooldown = slow_cooldown
+        self.lock = threading.Lock()
+        self.bisect = bisect.bisect
+        self.md5 = hashlib.md5
+        self.ring = sorted(
+            (self.hash("%s#%d" % (endpoint, replica)), endpoint)
+            for endpoint in endpoints for replica in range(replicas))
+        self.hashes = [point for point, _ in self.ring]
+        self.stats = OrderedDict(
+            (endpoint, {"requests": 0, "failures": 0, "failovers": 0,
+                        "latency_sum": 0.0, "latency_avg": None,
+                        "healthy": True})
+            for endpoint in endpoints)
+        self.slow_until = {}
+        self.health_thread = None
+
+    @classmethod
+    def from_env(cls, server_url):
+        """
+        Returns ServerRing for end points of server_url, configured with
+        env variables
+        """
+        return cls(parse_server_urls(server_url),
+                   slow_latency=get_env_float("SERVER_SLOW_LATENCY",
+                                              default=5.0),
+                   slow_cooldown=get_env_float("SERVER_SLOW_COOLDOWN",
+                                               default=30.0))
+
+    def hash(self, key):
+        return int(self.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+    def route(self, key):
+        """
+        Returns the end points in the order the call with routing key
+        is to be tried, available end points first
+        """
+        if len(self.endpoints) == 1:
+            return list(self.endpoints)
+        index = self.bisect(self.hashes, self.hash(key or ""))
+        order = []
+        for offset in range(len(self.ring)):
+            endpoint = self.ring[(index + offset) % len(self.ring)][1]
+            if endpoint not in order:
+                order.append(endpoint)
+                if len(order) == len(self.endpoints):
+                    break
+        # sorted is stable, keeping the ring order among available ones
+        return sorted(order, key=lambda endpoint: not self.available(endpoint))
+
+    def available(self, endpoint):
+        """
+        Returns False if end point is to be routed around
+        """
+        with self.lock:
+            if not self.stats[endpoint]["healthy"]:
+                return False
+            if monotonic_time() < self.slow_until.get(endpoint, 0):
+                return False
+        return not get_circuit_breaker(endpoint).is_open()
+
+    def record(self, endpoint, seconds, success, failover=False):
+        """
+        Record the outcome and latency of a call to end point
+        """
+        with self.lock:
+            stats = self.stats[endpoint]
+            stats["requests"] += 1
+            if not success:
+                stats["failures"] += 1
+            if failover:
+                stats["failovers"] += 1
+            stats["latency_sum"] += seconds
+            if stats["latency_avg"] is None:
+                stats["latency_avg"] = seconds
+            else:
+                stats["latency_avg"] += self.latency_weight * (
+                    seconds - stats["latency_avg"])
+            if self.slow_latency and stats["latency_avg"] > self.slow_latency:
+                self.slow_until[endpoint] = (monotonic_time() +
+                                             self.slow_cooldown)
+                # the average starts over once end point is back in rotation
+                stats["latency_avg"] = None
+
+    def check_health(self, api, timeout):
+        """
+        Make a GET call to api of every end point, marking the end points
+        not answering or answering with 5xx as unhealthy
+        """
+        import requests
+        session = get_http_session()
+        for endpoint in self.endpoints:
+            start = monotonic_time()
+            try:
+                r = session.get(urljoin(endpoint, api), timeout=timeout)
+                r.close()
+                healthy = r.status_code < 500
+            except requests.exceptions.RequestException:
+                healthy = False
+            with self.lock:
+                changed = self.stats[endpoint]["healthy"] != healthy
+                self.stats[endpoint]["healthy"] = healthy
+            if healthy:
+                self.record(endpoint, monotonic_time() - start, True)
+            if changed:
+                logging.getLogger("integration-scanner").warning(
+                    "Server %s is %s.", endpoint,
+                    "healthy again" if healthy else "unhealthy")
+
+    def start_health_checks(self, api, interval, timeout=5.0):
+        """
+        Run the active health checks every interval seconds on a
+        background thread
+        """
+        def check():
+            while True:
+                try:
+                    self.check_health(api, timeout)
+                except Exception as e:
+                    logging.getLogger("integration-scanner").warning(
+                        "Could not check health of servers: %s", e)
+                time.sleep(interval)
+
+        self.health_thread = threading.Thread(target=check)
+        self.health_thread.daemon = True
+        self.health_thread.start()
+
+    def to_dict(self):
+        """
+        Returns the per end point stats of calls
+        """
+        with self.lock:
+            stats = OrderedDict()
+            for endpoint, endpoint_stats in self.stats.items():
+                stats[endpoint] = dict(endpoint_stats)
+                stats[endpoint]["latency_sum"] = round(
+                    endpoint_stats["latency_sum"], 6)
+                if endpoint_stats["latency_avg"] is not None:
+                    stats[endpoint]["latency_avg"] = round(
+                        endpoint_stats["latency_avg"], 6)
+                stats[endpoint]["slow"] = (
+                    monotonic_time() < self.slow_until.get(endpoint, 0))
+        return stats
+
+
+# server url -> ServerRing of its end points
+_server_rings = {}
+_server_rings_lock = threading.Lock()
+
+
+def get_server_ring(server_url):
+    """
+    Returns the ServerRing for end points of server_url, creates it on first
+    call. With SERVER_HEALTH_INTERVAL seconds given, replicas are health
+    checked actively with GET calls to SERVER_HEALTH_API.
+    """
+    with _server_rings_lock:
+        if server_url not in _server_rings:
+            ring = ServerRing.from_env(server_url)
+            interval = get_env_float("SERVER_HEALTH_INTERVAL", default=0.0)
+            if interval > 0 and len(ring.endpoints) > 1:
+                ring.start_health_checks(
+                    os.environ.get("SERVER_HEALTH_API", "").strip() or "/",
+                    interval, timeout=get_server_timeout()[0])
+            _server_rings[server_url] = ring
+        return _server_rings[server_url]
+
+
+def server_ring_stats():
+    """
+    Returns the per end point stats of calls of all server rings
+    """
+    with _server_rings_lock:
+        rings = list(_server_rings.values())
+    stats = OrderedDict()
+    for ring in rings:
+        stats.update(ring.to_dict())
+    return stats
+
+
+def send_routed(server_url, key, call, stats=None):
+    """
+    Make the server call call(endpoint, retries) to the replica of
+    server_url routed to by key, failing over to the next replicas on ring
+    when the call fails or is answered with a 5xx status code.
+
+    Calls to all but the last replica tried are made with retries=0, so
+    that the call fails over right away, the call to the last replica is
+    retried as per RetryPolicy (retries=None).
+
+    :return: Tuple (endpoint, requests.Response) of the last call made
+    :raises: requests.exceptions.RequestException, CircuitOpenError of the
+             last call made
+    """
+    import requests
+    ring = get_server_ring(server_url)
+    endpoints = ring.route(key)
+    for index, endpoint in enumerate(endpoints):
+        last = index == len(endpoints) - 1
+        start = monotonic_time()
+        try:
+            r = call(endpoint, None if last else 0)
+        except CircuitOpenError:
+            if last:
+                raise
+        except requests.exceptions.RequestException:
+            ring.record(endpoint, monotonic_time() - start, False,
+                        failover=not last)
+            if last:
+                raise
+        else:
+            failed = r.status_code >= 500
+            ring.record(endpoint, monotonic_time() - start, not failed,
+                        failover=failed and not last)
+            if not failed or last:
+                if stats is not None and len(endpoints) > 1:
+                    stats["endpoint"] = endpoint
+                return endpoint, r
+            r.close()
+        if stats is not None:
+            stats["failovers"] = stats.get("failovers", 0) + 1
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter, allowing rate calls per second on average
+    with bursts of up to burst calls
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = monotonic_time()
+        self.lock = threading.Lock()
+
+    def take(self, tokens, updated, now):
+        """
+        Refill the bucket with tokens gained since updated, and take a token
+        if available. Returns (tokens left, seconds to wait for a token).
+        """
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+    def acquire(self):
+        """
+        Blocks until a call is allowed, returns the seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = monotonic_time()
+                self.tokens, wait = self.take(self.tokens, self.updated, now)
+                self.updated = now
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket shared by all the scanner processes on a host, its state
+    is kept in a file guarded by an exclusive file lock
+    """
+
+    def __init__(self, path, rate, burst):
+        super(FileTokenBucket, self).__init__(rate, burst)
+        self.path = path
+
+    def acquire(self):
+        import fcntl
+        waited = 0.0
+        while True:
+            with self.lock:
+                with open(self.path, "a+") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        f.seek(0)
+                        try:
+                            state = json.loads(f.read())
+                        except ValueError:
+                            state = {}
+                        # wall clock time, as it is shared across processes
+                        now = time.time()
+                        tokens, wait = self.take(
+                            state.get("tokens", self.burst),
+                            state.get("updated", now), now)
+                        f.seek(0)
+                        f.truncate()
+                        f.write(json.dumps({"tokens": tokens,
+                                            "updated": now}))
+                        f.flush()
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+# rate limiter for all the calls made to analytics server
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Returns the rate limiter for calls to analytics server as configured
+    with RATE_LIMIT, RATE_BURST and RATE_LIMIT_FILE env variables, None if
+    calls are not rate limited
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            rate = get_env_float("RATE_LIMIT", default=0.0)
+            if rate <= 0:
+                return None
+            burst = get_env_int("RATE_BURST", default=max(1, int(rate)),
+                                minimum=1)
+            path = os.environ.get("RATE_LIMIT_FILE", "").strip()
+            if path:
+                _rate_limiter = FileTokenBucket(path, rate, burst)
+            else:
+                _rate_limiter = TokenBucket(rate, burst)
+        return _rate_limiter
+
+
+def parse_retry_after(value):
+    """
+    Returns seconds to wait as per given Retry-After header value,
+    None if value is not given or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import mktime_tz, parsedate_tz
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, mktime_tz(parsed) - time.time())
+
+
+class RetryPolicy(object):
+    """
+    Bounded retries of server calls with exponential backoff and full
+    jitter, honoring Retry-After header of server responses
+    """
+
+    # response status codes worth retrying the call for
+    retry_status_codes = (429, 502, 503, 504)
+
+    def __init__(self, retries=3, backoff=0.5, backoff_max=30.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns RetryPolicy configured with env variables
+        """
+        return cls(retries=get_env_int("SERVER_RETRIES", default=3,
+                                       minimum=0),
+                   backoff=get_env_float("SERVER_BACKOFF", default=0.5),
+                   backoff_max=get_env_float("SERVER_BACKOFF_MAX",
+                                             default=30.0))
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns seconds to wait before retrying the call after attempt
+        (counted from 0)
+        """
+        retry_after = parse_retry_after(retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+
+def send_request(method, endpoint, api, stats=None, retries=None, **kwargs):
+    """
+    Make a call to analytics server using the shared HTTP session
+
+    Failed calls are retried as per RetryPolicy, and calls are
+    short-circuited while the circuit breaker for endpoint is open. Every
+    call, retries included, waits for the rate limiter if one is configured.
+
+    :param method: HTTP method to use, e.g. GET, POST
+    :param endpoint: API server end point
+    :param api: API to make the call against
+    :param stats: Optional dict to count the requests and retries made in,
+                  and to record the state of circuit breaker in
+    :param retries: Optional number of retries overriding SERVER_RETRIES
+    :param kwargs: Additional arguments for requests.Session.request
+
+    :return: requests.Response object
+    :raises: requests.exceptions.RequestException, CircuitOpenError
+    """
+    import requests
+    kwargs.setdefault("timeout", get_server_timeout())
+    url = urljoin(endpoint, api)
+    session = get_http_session()
+    breaker = get_circuit_breaker(endpoint)
+    policy = RetryPolicy.from_env()
+    if retries is not None:
+        policy.retries = retries
+    rate_limiter = get_rate_limiter()
+    if stats is None:
+        stats = {}
+
+    try:
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    "Circuit breaker for server {0} is open, not sending "
+                    "request to URL {1}.".format(endpoint, url))
+
+            if rate_limiter is not None:
+                waited = rate_limiter.acquire()
+                if waited:
+                    stats["rate_limited_seconds"] = round(
+                        stats.get("rate_limited_seconds", 0.0) + waited, 6)
+
+            stats["requests"] = stats.get("requests", 0) + 1
+            retry_after = None
+            try:
+                r = session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                breaker.record_failure()
+                if attempt >= policy.retries:
+                    raise
+            else:
+                if r.status_code not in policy.retry_status_codes:
+                    # 5xx answers count as failures of server
+                    if r.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return r
+                breaker.record_failure()
+                if attempt >= policy.retries:
+                    return r
+                retry_after = r.headers.get("Retry-After")
+                r.close()
+
+            time.sleep(policy.delay(attempt, retry_after))
+            attempt += 1
+            stats["retries"] = stats.get("retries", 0) + 1
+    finally:
+        stats["circuit_breaker"] = breaker.state
+
+
+def get_request_compression(env_name="REQUEST_COMPRESSION"):
+    """
+    Gets the compression of POST request bodies, one of none or gzip
+    """
+    value = os.environ.get(env_name, "").strip() or "none"
+    if value not in ("none", "gzip"):
+        raise ValueError(
+            "Invalid value %s for %s env variable, valid values are: "
+            "none, gzip" % (value, env_name))
+    return value
+
+
+def gzip_compress(data, level=6):
+    """
+    Returns gzip compressed data, gzip.compress is not available on python2
+    """
+    import zlib
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+# endpoints which answered a gzip compressed request body with 415
+_gzip_refused = set()
+
+
+def send_json_request(endpoint, api, data, stats=None, headers=None,
+                      retries=None):
+    """
+    Make a POST call to analytics server with data as JSON body. The
+    response is streamed, its body is read only once used, e.g. not for
+    a 415 answer.
+
+    With REQUEST_COMPRESSION=gzip, bodies of REQUEST_COMPRESSION_MIN_SIZE
+    bytes or more are sent gzip compressed. If server answers with 415
+    Unsupported Media Type, the body is sent again uncompressed, and so are
+    the later bodies for the endpoint. Responses are gzip compressed if
+    server chooses to, as Accept-Encoding header allows it. Calls are
+    retried as per send_request.
+
+    :return: requests.Response object
+    :raises: requests.exceptions.RequestException, CircuitOpenError
+    """
+    body = json.dumps(data)
+    if not isinstance(body, bytes):
+        body = body.encode("utf-8")
+    headers = dict(headers or {})
+    headers["Content-Type"] = "application/json"
+    if (endpoint not in _gzip_refused and
+            get_request_compression() == "gzip" and
+            len(body) >= get_env_int("REQUEST_COMPRESSION_MIN_SIZE",
+                                     default=1024, minimum=0)):
+        compressed_headers = dict(headers)
+        compressed_headers["Content-Encoding"] = "gzip"
+        r = send_request("POST", endpoint, api, stats=stats,
+                         retries=retries, data=gzip_compress(body),
+                         headers=compressed_headers, stream=True)
+        if r.status_code != 415:
+            return r
+        r.close()
+        _gzip_refused.add(endpoint)
+        logging.getLogger("integration-scanner").info(
+            "Server %s does not accept gzip compressed request bodies, "
+            "sending them uncompressed.", endpoint)
+    return send_request("POST", endpoint, api, stats=stats, retries=retries,
+                        data=body, headers=headers, stream=True)
+
+
+def idempotency_key(api, data):
+    """
+    Returns the idempotency key of POST call to api with given data, same
+    for every attempt of delivering the same payload
+    """
+    import hashlib
+    payload = json.dumps([api, data], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def post_request(endpoint, api, data, stats=None):
+    """
+    Make a post call to analytics server with given data.
+
+    Every call carries an Idempotency-Key header, so that server can drop
+    the payloads delivered again on replay from outbox. Concurrent calls
+    with the same endpoint, api and data share one server call, see
+    SingleFlight.
+
+    :param endpoint: API server end point
+    :param api: API to make POST call against
+    :param data: JSON data needed for POST call to api endpoint
+    :param stats: Optional dict to record server call stats in,
+                  see send_request and SingleFlight
+
+    :return: Tuple (status, error_if_any)
+             where status = True/False
+                   error_if_any = string message on error, "" on success
+    """
+    key = idempotency_key(api, data)
+    return _post_flights.do(
+        (endpoint, key),
+        lambda: send_post_request(endpoint, api, data, key, stats),
+        stats)
+
+
+def send_post_request(endpoint, api, data, key, stats=None):
+    """
+    Make a post call to analytics server with given data and idempotency
+    key, returns (status, error_if_any) as post_request.
+
+    With comma separated end points of server replicas, the call is routed
+    by git-url in data, see ServerRing.
+    """
+    import requests
+    # TODO: check if we need API key in data
+    try:
+        server, r = send_routed(
+            endpoint, routing_key(data),
+            lambda server, retries: send_json_request(
+                server, api, data, stats=stats,
+                headers={"Idempotency-Key": key}, retries=retries),
+            stats)
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        url = ", ".join(urljoin(server, api)
+                        for server in parse_server_urls(endpoint))
+        error = ("Could not send POST request to URL {0}, "
+                 "with data: {1}.").format(url, str(data))
+        return False, error + " Error: " + str(e)
+    try:
+        if r.status_code == requests.codes.ok:
+            return True, r.json()
+        # incl. retried calls, still answered with a retried status code
+        if stats is not None:
+            stats["status_code"] = r.status_code
+        return False, ("Returned non okay status code {0} on POST request "
+                       "to URL {1}.").format(r.status_code,
+                                             urljoin(server, api))
+    except ValueError as e:
+        # server answered, but not with JSON, e.g. an error page of a proxy
+        if stats is not None:
+            stats["status_code"] = r.status_code
+        return False, ("Could not decode JSON response of POST request to "
+                       "URL {0}. Error: {1}").format(urljoin(server, api),
+                                                     str(e))
+    finally:
+        r.close()
+
+
+class ReportCache(object):
+    """
+    On disk cache of server responses to GET calls, for making
+    conditional GET calls using their ETag and Last-Modified validators.
+
+    Response bodies are streamed to disk as received, and parsed once
+    from there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @classmethod
+    def from_env(cls, env_name="REPORT_CACHE_DIR"):
+        """
+        Returns ReportCache at directory in env variable, None if not set
+        """
+        path = os.environ.get(env_name, "").strip()
+        if not path:
+            return None
+        return cls(path)
+
+    def key(self, url, params):
+        import hashlib
+        request = json.dumps([url, sorted((params or {}).items())])
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def validators(self, key):
+        """
+        Returns the conditional request headers for cached response of key,
+        empty dict if nothing is cached
+        """
+        meta_path = os.path.join(self.path, key + ".meta")
+        body_path = os.path.join(self.path, key + ".json")
+        if not (os.path.isfile(meta_path) and os.path.isfile(body_path)):
+            return {}
+        with open(meta_path) as f:
+            meta = json.load(f)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, key):
+        """
+        Returns the JSON data of cached response of key
+        """
+        with open(os.path.join(self.path, key + ".json"), "rb") as f:
+            return json.load(f)
+
+    def store(self, key, response, chunk_size=65536):
+        """
+        Streams the body of response into cache as response of key,
+        returns its JSON data
+        """
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+            os.rename(tmp_path, os.path.join(self.path, key + ".json"))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        meta = {"etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")}
+        with open(os.path.join(self.path, key + ".meta"), "w") as f:
+            json.dump(meta, f)
+        return self.load(key)
+
+
+def get_request(endpoint, api, params=None, stats=None, cache=None):
+    """
+    Make a get call to analytics server
+
+    The response JSON is decoded once, from disk if a ReportCache is
+    given. With a ReportCache, the call is made conditional on the cached
+    response having changed, and a 304 Not Modified response is answered
+    from the cache.
+    With comma separated end points of server replicas, the call is routed
+    by git-url in params, see ServerRing.
+
+    :param endpoint: API server end point
+    :param api: API to make GET call against
+    :param params: Query parameters to be sent with GET call
+    :param stats: Optional dict to record server call stats in,
+                  see send_request
+    :param cache: Optional ReportCache for conditional GET calls
+
+    :return: Tuple (status, data_or_error)
+             where status = True/False
+                   data_or_error = data received from get call on success,
+                                   string message on error
+    """
+    import requests
+
+    def call(server, retries):
+        headers = {}
+        if cache is not None:
+            headers = cache.validators(cache.key(urljoin(server, api),
+                                                 params))
+        return send_request("GET", server, api, stats=stats,
+                            retries=retries, params=params, headers=headers,
+                            stream=True)
+
+    try:
+        server, r = send_routed(endpoint, routing_key(params), call, stats)
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        url = ", ".join(urljoin(server, api)
+                        for server in parse_server_urls(endpoint))
+        error = "Could not send GET request to URL {0}.".format(url)
+        return False, error + " Error: " + str(e)
+
+    url = urljoin(server, api)
+    key = cache.key(url, params) if cache is not None else None
+    conditional = ("If-None-Match" in r.request.headers or
+                   "If-Modified-Since" in r.request.headers)
+    try:
+        if r.status_code == requests.codes.not_modified and conditional:
+            if stats is not None:
+                stats["not_modified"] = stats.get("not_modified", 0) + 1
+            return True, cache.load(key)
+        if r.status_code == requests.codes.ok:
+            if cache is not None:
+                return True, cache.store(key, r)
+            return True, r.json()
+        if stats is not None:
+            stats["status_code"] = r.status_code
+        return False, ("Returned non okay status code {0} on GET "
+                       "request to URL {1}.").format(r.status_code, url)
+    except ValueError as e:
+        if stats is not None:
+            stats["status_code"] = r.status_code
+        return False, ("Could not decode JSON response of GET request to "
+                       "URL {0}. Error: {1}").format(url, str(e))
+    finally:
+        r.close()
+
+
+def get_server_api(scan_type):
+    """
+    Returns the server API to be called for given scan type
+    """
+    if scan_type == "get_report":
+        return os.environ.get("REPORT_API", "").strip() or "/api/v1/report"
+    return "/api/v1/register"
+
+
+def get_register_batch_size(env_name="REGISTER_BATCH_SIZE"):
+    """
+    Gets the number of registrations to be sent in one bulk POST call
+    """
+    return get_env_int(env_name, default=1, minimum=1)
+
+
+def get_register_flush_interval(env_name="REGISTER_FLUSH_INTERVAL"):
+    """
+    Gets the seconds a partially filled registration batch waits for more
+    registrations before being sent
+    """
+    return get_env_float(env_name, default=1.0)
+
+
+def get_register_bulk_api(env_name="REGISTER_BULK_API"):
+    """
+    Gets the server API accepting a list of registrations in one POST call
+    """
+    return os.environ.get(env_name, "").strip() or "/api/v1/register/bulk"
+
+
+class PendingRequest(object):
+    """
+    A server call queued for batching, holds the result once it is sent
+    """
+
+    def __init__(self, endpoint, api, data, stats=None):
+        self.endpoint = endpoint
+        self.api = api
+        self.data = data
+        self.stats = stats if stats is not None else {}
+        self.result = None
+        self.done = threading.Event()
+        self.submitted = monotonic_time()
+        # seconds from queuing the request to receiving its result
+        self.latency = None
+
+    def set_result(self, status, resp):
+        self.result = (status, resp)
+        self.latency = monotonic_time() - self.submitted
+        self.done.set()
+
+    def wait(self):
+        """
+        Blocks until the request is sent, returns the (status, response)
+        """
+        self.done.wait()
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent identical server calls: while a call for a key
+    is in flight, calls for the same key wait for it and get a copy of its
+    (status, response), instead of calling the server themselves.
+
+    Stats of the call made are marked with the number of callers it was
+    shared with as "coalesced_callers", stats of the callers sharing it
+    with "coalesced".
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [PendingRequest in flight, number of callers sharing it]
+        self.flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, stats=None):
+        """
+        Returns the (status, response) of func(), or a copy of the result
+        of call to func in flight for the same key
+        """
+        import copy
+        if stats is None:
+            stats = {}
+        with self.lock:
+            self.calls += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = [
+                    PendingRequest(None, None, None, stats), 0]
+            else:
+                flight[1] += 1
+                self.coalesced += 1
+
+        if not leader:
+            status, resp = flight[0].wait()
+            stats["coalesced"] = stats.get("coalesced", 0) + 1
+            stats["circuit_breaker"] = flight[0].stats.get(
+                "circuit_breaker", stats.get("circuit_breaker"))
+            if "status_code" in flight[0].stats:
+                stats["status_code"] = flight[0].stats["status_code"]
+            # callers go on to modify the response in their results
+            return status, copy.deepcopy(resp)
+
+        result = (False, "Server call failed.")
+        try:
+            result = func()
+        finally:
+            # later calls for key start a new call, from here on
+            with self.lock:
+                del self.flights[key]
+            if flight[1]:
+                stats["coalesced_callers"] = (
+                    stats.get("coalesced_callers", 0) + flight[1])
+            # callers copy a private snapshot, the response returned here
+            # is modified by the caller while they copy it
+            flight[0].set_result(result[0], copy.deepcopy(result[1]))
+        return result
+
+    def stats(self):
+        """
+        Returns the counts of calls and of calls sharing another call
+        """
+        with self.lock:
+            return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+# coalesces the concurrent identical POST calls to analytics server
+_post_flights = SingleFlight()
+
+
+class RegistrationBatcher(object):
+    """
+    Collects the registrations of multiple containers and sends them to
+    server in chunked bulk POST calls.
+
+    A batch is sent when batch_size registrations are collected or when
+    flush_interval seconds have passed since first registration in batch.
+    If the server does not support bulk API, registrations are sent with
+    one POST call each.
+    """
+
+    # status codes for which bulk API is considered not supported by server
+    unsupported_status_codes = (404, 405, 501)
+
+    def __init__(self, api, bulk_api, batch_size, flush_interval):
+        self.api = api
+        self.bulk_api = bulk_api
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.bulk_supported = True
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+        self.bulk_calls = 0
+        self.single_calls = 0
+
+    def submit(self, endpoint, api, data, stats=None):
+        """
+        Queue the POST call of data to endpoint/api, returns PendingRequest
+        """
+        request = PendingRequest(endpoint, api, data, stats)
+        if api != self.api:
+            # only registrations are batched
+            request.set_result(
+                *post_request(endpoint, api, data, stats=request.stats))
+            return request
+
+        with self.lock:
+            self.pending.append(request)
+            if len(self.pending) >= self.batch_size:
+                batch = self._take_batch()
+            else:
+                batch = None
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flush_interval,
+                                                 self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if batch:
+            self.send(batch)
+        return request
+
+    def post_request(self, endpoint, api, data, stats=None):
+        """
+        Same as post_request, but the call is sent as part of a batch
+        """
+        return self.submit(endpoint, api, data, stats).wait()
+
+    def _take_batch(self):
+        # must be called with self.lock held
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def flush(self):
+        """
+        Send the registrations collected so far
+        """
+        with self.lock:
+            batch = self._take_batch()
+        if batch:
+            self.send(batch)
+
+    def send(self, batch):
+        """
+        Send the batch of registrations and set result of each request
+        """
+        # registrations are grouped by the server replica they are routed to
+        by_endpoint = {}
+        for request in batch:
+            endpoint = get_server_ring(request.endpoint).route(
+                routing_key(request.data))[0]
+            by_endpoint.setdefault((request.endpoint, endpoint),
+                                   []).append(request)
+
+        for (server_url, endpoint), requests_ in by_endpoint.items():
+            # with replicas, failed bulk calls are sent per registration
+            # for them to fail over to other replicas
+            failover = len(parse_server_urls(server_url)) > 1
+            for start in range(0, len(requests_), self.batch_size):
+                chunk = requests_[start:start + self.batch_size]
+                if len(chunk) > 1 and self.bulk_supported:
+                    if self.send_bulk(endpoint, chunk, failover):
+                        continue
+                for request in chunk:
+                    self.single_calls += 1
+                    request.set_result(
+                        *post_request(server_url, request.api, request.data,
+                                      stats=request.stats))
+
+    def send_bulk(self, endpoint, chunk, failover=False):
+        """
+        Send the chunk of registrations in one POST call to bulk API of
+        endpoint. With failover, a chunk failing to be sent is to be sent
+        per registration.
+
+        :return: True if result of every request in chunk is set,
+                 False if the chunk needs to be sent per registration
+        """
+        import requests
+        url = urljoin(endpoint, self.bulk_api)
+        data = [request.data for request in chunk]
+        self.bulk_calls += 1
+        stats = {}
+        try:
+            # with failover, registrations sent per registration are
+            # retried instead
+            r = send_json_request(endpoint, self.bulk_api, data, stats=stats,
+                                  retries=0 if failover else None)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            self.merge_stats(chunk, stats)
+            if failover:
+                return False
+            error = ("Could not send POST request to URL {0}, "
+                     "with data: {1}.").format(url, str(data))
+            for request in chunk:
+                request.set_result(False, error + " Error: " + str(e))
+            return True
+
+        self.merge_stats(chunk, stats)
+        try:
+            if r.status_code in self.unsupported_status_codes:
+                logging.getLogger("integration-scanner").info(
+                    "Bulk API %s is not supported by server, falling back "
+                    "to one POST call per registration.", url)
+                self.bulk_supported = False
+                return False
+
+            if r.status_code != requests.codes.ok:
+                return False
+
+            responses = r.json()
+        except ValueError:
+            return False
+        finally:
+            r.close()
+        # the bulk API returns responses in the same order as registrations
+        if not isinstance(responses, list) or len(responses) != len(chunk):
+            return False
+
+        for request, resp in zip(chunk, responses):
+            request.set_result(True, resp)
+        return True
+
+    def merge_stats(self, chunk, stats):
+        """
+        Add the stats of bulk call to the stats of requests in chunk. The
+        requests and retries made are added to the stats of first request
+        only, so that they are counted once per call, every request records
+        the number of registrations sent in the call as "bulk_size".
+        """
+        for index, request in enumerate(chunk):
+            if index == 0:
+                for key in ("requests", "retries"):
+                    request.stats[key] = (request.stats.get(key, 0) +
+                                          stats.get(key, 0))
+            request.stats["bulk_size"] = len(chunk)
+            request.stats["circuit_breaker"] = stats.get("circuit_breaker")
+
+
+def get_registration_cache_path(env_name="REGISTRATION_CACHE"):
+    """
+    Gets the path of on disk registration cache, None if not configured
+    """
+    return os.environ.get(env_name, "").strip() or None
+
+
+class RegistrationCache(object):
+    """
+    On disk SQLite cache of server responses to registrations, keyed by
+    (git-url, git-sha) of the image.
+
+    Entries older than ttl seconds are not served, and least recently used
+    entries are evicted once the cache holds more than size entries.
+    """
+
+    def __init__(self, path, ttl=3600, size=10000):
+        self.path = path
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        import sqlite3
+        # the connection is shared by scan workers, guarded by self.lock
+        self.connection = sqlite3.connect(path, timeout=30,
+                                          check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS registrations ("
+                "git_url TEXT NOT NULL, "
+                "git_sha TEXT NOT NULL, "
+                "response TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "accessed REAL NOT NULL, "
+                "PRIMARY KEY (git_url, git_sha))")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns RegistrationCache configured with env variables, None if
+        the cache is not configured
+        """
+        path = get_registration_cache_path()
+        if not path:
+            return None
+        return cls(path,
+                   ttl=get_env_int("REGISTRATION_CACHE_TTL", default=3600,
+                                   minimum=0),
+                   size=get_env_int("REGISTRATION_CACHE_SIZE",
+                                    default=10000, minimum=1))
+
+    def get(self, git_url, git_sha):
+        """
+        Returns the cached server response for (git_url, git_sha),
+        None if there is no fresh response cached
+        """
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                row = self.connection.execute(
+                    "SELECT response, created FROM registrations "
+                    "WHERE git_url = ? AND git_sha = ?",
+                    (git_url, git_sha)).fetchone()
+                if row is None or now - row[1] > self.ttl:
+                    self.misses += 1
+                    return None
+                self.connection.execute(
+                    "UPDATE registrations SET accessed = ? "
+                    "WHERE git_url = ? AND git_sha = ?",
+                    (now, git_url, git_sha))
+                self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, git_url, git_sha, response):
+        """
+        Cache the server response for (git_url, git_sha)
+        """
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO registrations "
+                    "(git_url, git_sha, response, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (git_url, git_sha, json.dumps(response), now, now))
+                # evict the least recently used entries beyond cache size
+                self.connection.execute(
+                    "DELETE FROM registrations WHERE rowid IN ("
+                    "SELECT rowid FROM registrations "
+                    "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.size,))
+
+    def stats(self):
+        """
+        Returns the hit and miss counts of cache
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def get_outbox_path(env_name="OUTBOX_PATH"):
+    """
+    Gets the path of on disk outbox of undelivered calls, None if not
+    configured
+    """
+    return os.environ.get(env_name, "").strip() or None
+
+
+class Outbox(object):
+    """
+    On disk SQLite outbox of POST calls which could not be delivered to
+    analytics server, i.e. registrations and error reports made while the
+    server was unreachable.
+
+    Entries are keyed by idempotency key of the call, so a payload is
+    queued only once, and oldest entries are dropped once outbox holds
+    more than size entries.
+
+    Only calls which may be delivered later are queued, i.e. the ones
+    server did not answer, answered with a 5xx status or asked to be sent
+    again later. Calls server rejected with other status codes would be
+    rejected again on every replay.
+    """
+
+    # 4xx status codes of calls worth delivering again later
+    retry_status_codes = (408, 429)
+
+    def __init__(self, path, size=10000, batch_size=100):
+        self.path = path
+        self.size = size
+        self.batch_size = batch_size
+        self.queued = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        import sqlite3
+        # the connection is shared by scan workers, guarded by self.lock
+        self.connection = sqlite3.connect(path, timeout=30,
+                                          check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "key TEXT NOT NULL UNIQUE, "
+                "endpoint TEXT NOT NULL, "
+                "api TEXT NOT NULL, "
+                "data TEXT NOT NULL, "
+                "created REAL NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "last_error TEXT)")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns Outbox configured with env variables, None if the outbox
+        is not configured
+        """
+        path = get_outbox_path()
+        if not path:
+            return None
+        return cls(path,
+                   size=get_env_int("OUTBOX_SIZE", default=10000, minimum=1),
+                   batch_size=get_env_int("OUTBOX_BATCH_SIZE", default=100,
+                                          minimum=1))
+
+    @classmethod
+    def retryable(cls, status_code):
+        """
+        Returns True if the call failed with status_code, None if server
+        did not answer it, is worth delivering again later
+        """
+        return (status_code is None or status_code >= 500 or
+                status_code in cls.retry_status_codes)
+
+    def put(self, endpoint, api, data):
+        """
+        Queue the POST call to api of endpoint with given data for later
+        delivery, returns the idempotency key of call
+        """
+        key = idempotency_key(api, data)
+        with self.lock:
+            with self.connection:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(key, endpoint, api, data, created) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, endpoint, api, json.dumps(data), time.time()))
+                self.queued += cursor.rowcount
+                # drop the oldest entries beyond outbox size
+                self.connection.execute(
+                    "DELETE FROM outbox WHERE id IN ("
+                    "SELECT id FROM outbox "
+                    "ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (self.size,))
+        return key
+
+    def pending(self, limit, after=0):
+        """
+        Returns up to limit oldest queued calls queued after the call with
+        id after, as (id, endpoint, api, data) tuples
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, endpoint, api, data FROM outbox WHERE id > ? "
+                "ORDER BY id LIMIT ?", (after, limit)).fetchall()
+        return [(row[0], row[1], row[2], json.loads(row[3]))
+                for row in rows]
+
+    def delivered(self, entry_id):
+        """
+        Remove the delivered call from outbox
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+    def drop(self, entry_id, error):
+        """
+        Remove the queued call rejected by server from outbox
+        """
+        logging.getLogger("integration-scanner").warning(
+            "Dropping call %d rejected by server from outbox %s: %s",
+            entry_id, self.path, error)
+        self.delivered(entry_id)
+        self.dropped += 1
+
+    def failed(self, entry_id, error):
+        """
+        Record the failed delivery attempt of queued call
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, "
+                    "last_error = ? WHERE id = ?", (error, entry_id))
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def replay(self):
+        """
+        Deliver the queued calls to analytics server in batches of
+        batch_size, oldest first. Calls are removed from outbox once server
+        answers them with 2xx status, or rejects them, see retryable.
+        Stops at first call which failed otherwise, as the server is likely
+        still unreachable. Rejected calls are counted in self.dropped.
+
+        :return: Tuple (delivered, failed) counts of calls
+        """
+        delivered = 0
+        last_id = 0
+        while True:
+            batch = self.pending(self.batch_size, after=last_id)
+            if not batch:
+                break
+            for entry_id, endpoint, api, data in batch:
+                last_id = entry_id
+                stats = {}
+                status, out = post_request(endpoint, api, data, stats)
+                if not status:
+                    if not self.retryable(stats.get("status_code")):
+                        self.drop(entry_id, out)
+                        continue
+                    self.failed(entry_id, out)
+                    return delivered, 1
+                self.delivered(entry_id)
+                delivered += 1
+        return delivered, 0
+
+    def drain(self, interval):
+        """
+        Replay the queued calls every interval seconds, until killed
+        """
+        logger = logging.getLogger("integration-scanner")
+        while True:
+            time.sleep(interval)
+            dropped = self.dropped
+            try:
+                delivered, failed = self.replay()
+            except Exception as e:
+                logger.warning("Could not replay outbox %s: %s",
+                               self.path, e)
+                continue
+            if delivered or failed or self.dropped != dropped:
+                logger.info("Replayed outbox %s: %d delivered, %d failed, "
+                            "%d dropped.", self.path, delivered, failed,
+                            self.dropped - dropped)
+
+
+class ScanRecord(object):
+    """
+    Result of scan of a container, with a fixed set of fields.
+
+    Fields are read and set by their exported names, e.g.
+    record["Scan Results"], and exported in fixed order by to_dict. Start
+    and finish times are kept as datetime, formatted only on export.
+    """
+
+    # (exported name, attribute) of fields, in export order
+    fields = (
+        ("Start Time", "start_time"),
+        ("Finished Time", "finished_time"),
+        ("Successful", "successful"),
+        ("Scan Type", "scan_type"),
+        ("UUID", "uuid"),
+        ("CVE Feed Last Updated", "cve_feed_last_updated"),
+        ("Scanner", "scanner"),
+        ("Scan Results", "scan_results"),
+        ("Summary", "summary"),
+        ("Error Class", "error_class"),
+        ("Label Fingerprint", "label_fingerprint"),
+        ("Server Requests", "server_requests"),
+        ("Phase Timings", "phase_timings"),
+    )
+    attributes = dict(fields)
+    time_fields = ("Start Time", "Finished Time")
+    time_format = "%Y-%m-%d-%H-%M-%S-%f"
+
+    __slots__ = tuple(attribute for _, attribute in fields)
+
+    def __init__(self, scanner, scan_type, uuid, start_time=None):
+        for _, attribute in self.fields:
+            setattr(self, attribute, None)
+        self.start_time = start_time or datetime.now()
+        self.successful = False
+        self.scan_type = scan_type
+        self.uuid = uuid
+        self.cve_feed_last_updated = "NA"
+        self.scanner = scanner
+        self.scan_results = {}
+        self.summary = ""
+
+    def __getitem__(self, name):
+        return getattr(self, self.attributes[name])
+
+    def __setitem__(self, name, value):
+        setattr(self, self.attributes[name], value)
+
+    def to_dict(self):
+        """
+        Returns the record as dict of exported names, fields not set are
+        left out
+        """
+        output = OrderedDict()
+        for name, attribute in self.fields:
+            value = getattr(self, attribute)
+            if value is None:
+                continue
+            if name in self.time_fields and isinstance(value, datetime):
+                value = value.strftime(self.time_format)
+            output[name] = value
+        return output
+
+    @classmethod
+    def from_dict(cls, output):
+        """
+        Returns the record for dict of exported names, as returned by
+        to_dict
+        """
+        record = cls(output.get("Scanner"), output.get("Scan Type"),
+                     output.get("UUID"))
+        for name, value in output.items():
+            if name not in cls.attributes:
+                continue
+            if name in cls.time_fields and value is not None:
+                value = datetime.strptime(value, cls.time_format)
+            record[name] = value
+        return record
+
+
+class AnalyticsIntegration(object):
+    """
+    Analytics integrtion related tasks wrapped in this calls
+    """
+
+    # labels must be present in image
+    needed_labels = ("git-url", "git-sha", "email-ids")
+
+    def __init__(self, container, scan_type, registration_cache=None,
+                 label_source=None, image_name=None, server_url=None,
+                 report_cache=None, outbox=None):
+        """
+        Initialize object variables specific to per container scanning
+        """
+        self.scanner = "scanner-analytics-integration"
+        self.container = container
+        # scan_type = [register, scan, get_report]
+        self.scan_type = scan_type
+        # RegistrationCache to look up the server responses in, if any
+        self.registration_cache = registration_cache
+        self.cache_hit = False
+        # ReportCache for conditional report fetching, if any
+        self.report_cache = report_cache
+        # Outbox to queue the undelivered server calls in, if any
+        self.outbox = outbox
+        # LabelSource to look up the image labels with
+        self.label_source = label_source
+        self.image_uuid = None
+        # following are the labels must be present in image
+        self.needed_labels_names = list(self.needed_labels)
+        # following three variables need to be processed later
+        self.label_data = None
+        # if not given, these are read from env variables
+        self.image_name = image_name
+        self.server_url = server_url
+        # This will contain the result/error data
+        self.respone = None
+        self.errors = []
+        # class of the first fatal error, e.g. missing_label
+        self.error_class = None
+        self.failure = True
+        # counts of requests and retries made to server, with the state of
+        # server circuit breaker after the last request
+        self.server_stats = {"requests": 0, "retries": 0,
+                             "circuit_breaker": "NA"}
+        # timings of the phases of scan
+        self.timings = PhaseTimings()
+        # the labels needed for calling server APIs
+        self.recorded_labels = {}
+        # the needed data to be logged in scanner output
+        self.data = {}
+        # the templated data this scanner will export
+        self.json_out = self.template_json_data(self.scanner,
+                                                self.scan_type,
+                                                container[1:])
+
+    def template_json_data(self, scanner, scan_type, uuid):
+        """
+        Populate and return a template standard json data out for scanner.
+        """
+        return ScanRecord(scanner, scan_type, uuid)
+
+    def record_fatal_error(self, error, error_class="unknown"):
+        self.errors.append(str(error))
+        self.error_class = self.error_class or error_class
+
+    def record_label(self, name, value):
+        self.recorded_labels[name] = value.strip()
+
+    def post_scanner_error(self):
+        """
+        Upon issues with input data to scanner, invoke /scanner-error POST API
+        """
+        # in case of SERVER env var is not give, we wont be able to even
+        # post the error to /scanner-error APIs
+        if not self.server_url:
+            msg = ("Can't report errors via /scanner-error API, "
+                   "as SERVER URL is not given in scanner command.")
+            return False, msg
+
+        post_data = {
+            "image-name": self.data.get("image_name", ""),
+            "email-ids": self.recorded_labels.get("email-ids", ""),
+            "error": self.errors,
+        }
+
+        api = "/api/v1/scanner-error"
+
+        # stats keep the status code of the scan's server call, the status
+        # code of this call decides whether it is queued
+        scan_status_code = self.server_stats.pop("status_code", None)
+        with self.timings.phase("error_report"):
+            status, out = post_request(endpoint=self.server_url,
+                                       api=api,
+                                       data=post_data,
+                                       stats=self.server_stats)
+        status_code = self.server_stats.pop("status_code", None)
+        if scan_status_code is not None:
+            self.server_stats["status_code"] = scan_status_code
+        if not status:
+            return status, self.queue_call(api, post_data, out, status_code)
+        else:
+            return True, "Reported errors via /scanner-error POST API."
+
+    def queue_call(self, api, data, error, status_code=None):
+        """
+        Queue the undelivered POST call to api in outbox, if configured and
+        the call failed with a status_code worth delivering it again later,
+        returns the error message noting so
+        """
+        if self.outbox is None or not Outbox.retryable(status_code):
+            return error
+        self.outbox.put(self.server_url, api, data)
+        self.server_stats["queued"] = self.server_stats.get("queued", 0) + 1
+        return error + " Queued in outbox for later delivery."
+
+    def return_on_failure(self):
+        if self.failure:
+            # report errors on analytics server before returning the scanner
+            status, out = self.post_scanner_error()
             # in either case of whethere status=true/false, add note in Summary
             # about status for reporting the errors via /scanner-error API
             self.errors.append(out)
-            current_time = datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
-            self.json_out["Finished Time"] = current_time
+            self.json_out["Finished Time"] = datetime.now()
             self.json_out["Successful"] = False
             self.json_out["Scan Results"] = self.data
             self.json_out["Summary"] = "Error: %s" % str(self.errors)
-            return False, self.json_out
+            self.json_out["Error Class"] = self.error_class or "unknown"
+            self.json_out["Server Requests"] = self.server_stats
+            self.json_out["Phase Timings"] = self.timings.to_dict()
+            return False, self.json_out.to_dict()
 
     def verify_recorded_labels(self):
         pass
 
-    def run(self):
+    @scan_log_context
+    def prepare(self):
         """
-        Run the needed tasks for scanning container under test
+        Run the tasks needed before calling the server for container under
+        test, i.e. read the inputs and retrieve the labels from image.
+
+        :return: None if container is ready for server call, else the
+                 (False, json_out) tuple to be returned by scanner
         """
         try:
-            self.image_name = get_image_name()
-            self.server_url = get_server_url()
+            with self.timings.phase("inputs"):
+                self.image_name = self.image_name or get_image_name()
+                self.server_url = self.server_url or get_server_url()
         except ValueError as e:
-            self.record_fatal_error(e)
+            self.record_fatal_error(e, "missing_input")
             self.failure = True
             return self.return_on_failure()
         else:
@@ -270,20 +2491,21 @@ class AnalyticsIntegration(object):
             self.data["server_url"] = self.server_url
 
         try:
-            self.docker_client = connect_local_docker_socket()
+            if self.label_source is None:
+                self.label_source = LabelSource.from_env()
+            self.image_uuid, labels = self.label_source.get_labels(
+                self.image_name, self.container, self.timings)
         except Exception as e:
-            self.record_fatal_error(e)
+            self.record_fatal_error(e, "label_source")
             self.failure = True
             return self.return_on_failure()
-        else:
-            self.failure = False
 
-        self.run_object.image = self.image_name
         for label in self.needed_labels_names:
             try:
-                value = find_label(self.run_object, self.image_name, label)
+                with self.timings.phase("find_label." + label):
+                    value = find_label(labels, self.image_name, label)
             except EmptyLabelException as e:
-                self.record_fatal_error(e)
+                self.record_fatal_error(e, "missing_label")
                 self.failure = True
             else:
                 self.failure = False
@@ -298,37 +2520,140 @@ class AnalyticsIntegration(object):
 
         # record the labels in data as well
         self.data.update(self.recorded_labels)
+        self.json_out["Label Fingerprint"] = label_fingerprint(
+            self.recorded_labels)
+        return None
 
-        if self.scan_type in ["register", "scan"]:
-            api = "/api/v1/register"
-        # TODO: add case report command
-        else:
-            api = "/api/v1/register"
+    def server_api(self):
+        """
+        Returns the server API to be called for the scan type
+        """
+        return get_server_api(self.scan_type)
 
-        status, resp = post_request(endpoint=self.server_url,
-                                    api=api,
-                                    data=self.recorded_labels)
+    def cached_response(self):
+        """
+        Returns the cached server response for recorded labels, None if
+        there is no registration cache or no fresh response cached
+        """
+        if self.registration_cache is None:
+            return None
+        with self.timings.phase("registration_cache"):
+            resp = self.registration_cache.get(
+                self.recorded_labels.get("git-url", ""),
+                self.recorded_labels.get("git-sha", ""))
+        self.cache_hit = resp is not None
+        return resp
+
+    def cache_response(self, resp):
+        """
+        Cache the server response for recorded labels
+        """
+        if (self.registration_cache is None or self.cache_hit or
+                self.scan_type == "get_report"):
+            return
+        # non okay status code on POST call returns a message, not data
+        if isinstance(resp, dict):
+            self.registration_cache.put(
+                self.recorded_labels.get("git-url", ""),
+                self.recorded_labels.get("git-sha", ""),
+                resp)
+
+    @scan_log_context
+    def process_response(self, status, resp):
+        """
+        Process the (status, response) of the server call made with
+        recorded labels and return the scanner output
+        """
         if not status:
             self.failure = True
-            self.record_fatal_error(resp)
-            return self.return_on_failure()
+            if self.scan_type != "get_report":
+                resp = self.queue_call(
+                    self.server_api(), self.recorded_labels, resp,
+                    self.server_stats.get("status_code"))
+            # server answered with an error status code, or not at all
+            self.record_fatal_error(
+                resp, "server_error" if "status_code" in self.server_stats
+                else "server_unreachable")
+            result = self.return_on_failure()
+        else:
+            self.cache_response(resp)
+            # if there are no return on data failures, return True
+            result = self.return_on_success(resp)
+
+        if self.registration_cache is not None:
+            cache_stats = self.registration_cache.stats()
+            cache_stats["hit"] = self.cache_hit
+            self.json_out["Scan Results"]["registration_cache"] = cache_stats
+        return result
+
+    def run(self):
+        """
+        Run the needed tasks for scanning container under test
+        """
+        failure = self.prepare()
+        if failure is not None:
+            return failure
+        return self.call_server()
+
+    @scan_log_context
+    def call_server(self):
+        """
+        Call the server with recorded labels and return the scanner output.
+        To be called after successful prepare.
+        """
+        if self.scan_type == "get_report":
+            return self.fetch_report()
+        return self.register()
+
+    def fetch_report(self):
+        """
+        Fetch the last scan report for recorded git-url and git-sha
+        """
+        params = {"git-url": self.recorded_labels.get("git-url", ""),
+                  "git-sha": self.recorded_labels.get("git-sha", "")}
+        with self.timings.phase("server_request"):
+            status, resp = get_request(endpoint=self.server_url,
+                                       api=self.server_api(),
+                                       params=params,
+                                       stats=self.server_stats,
+                                       cache=self.report_cache)
+        return self.process_response(status, resp)
+
+    def register(self):
+        """
+        Register recorded labels with server, or look the response up in
+        registration cache, and return the scanner output.
+        """
+        resp = self.cached_response()
+        if resp is not None:
+            return self.process_response(True, resp)
 
-        # if there are no return on data failures, return True
-        return self.return_on_success(resp)
+        with self.timings.phase("server_request"):
+            status, resp = post_request(endpoint=self.server_url,
+                                        api=self.server_api(),
+                                        data=self.recorded_labels,
+                                        stats=self.server_stats)
+        return self.process_response(status, resp)
 
     def return_on_success(self, resp):
         """
         Process output of scanner after successful POST call to server
         """
         self.json_out["Successful"] = True
-        current_time = datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
-        self.json_out["Finished Time"] = current_time
+        self.json_out["Finished Time"] = datetime.now()
+        self.json_out["Server Requests"] = self.server_stats
+        self.json_out["Phase Timings"] = self.timings.to_dict()
         # if repository is registered for first time, no `last_scan_report`
         # key will be there
         if "last_scan_report" in resp:
             self.json_out["Scan Results"] = resp
             self.json_out["Summary"] = (
                 "Last scan report available in 'Scan Results' field.")
+        elif self.scan_type == "get_report":
+            self.json_out["Scan Results"] = self.data
+            self.json_out["Summary"] = (
+                "No scan report available yet, register the repository "
+                "for scan first.")
         else:
             # `last_scan_report` is in response if it is subsequent call
             self.json_out["Scan Results"] = self.data
@@ -337,7 +2662,724 @@ class AnalyticsIntegration(object):
                 "report will be availble in next run after some time.")
 
         # return True and output data from scanner
-        return True, self.json_out
+        return True, self.json_out.to_dict()
+
+
+class MetricsEmitter(object):
+    """
+    Emits the phase timings of scans as Prometheus textfile metrics and/or
+    statsd timers.
+
+    The textfile at textfile_path (for node exporter's textfile collector)
+    is written when emitter is closed. statsd timers are sent over UDP to
+    statsd_address "host:port" as timings are observed.
+    """
+
+    def __init__(self, textfile_path=None, statsd_address=None,
+                 prefix="analytics_scanner"):
+        self.textfile_path = textfile_path
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # phase -> [sum of seconds, count]
+        self.phases = OrderedDict()
+        self.statsd_socket = None
+        self.statsd_address = None
+        if statsd_address:
+            host, _, port = statsd_address.rpartition(":")
+            self.statsd_address = (host, int(port))
+            self.statsd_socket = socket.socket(socket.AF_INET,
+                                               socket.SOCK_DGRAM)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns MetricsEmitter configured with env variables, None if no
+        metrics output is configured
+        """
+        textfile_path = os.environ.get("METRICS_TEXTFILE", "").strip()
+        statsd_address = os.environ.get("STATSD_ADDRESS", "").strip()
+        if not textfile_path and not statsd_address:
+            return None
+        return cls(textfile_path=textfile_path or None,
+                   statsd_address=statsd_address or None)
+
+    def observe(self, phase, seconds):
+        """
+        Record the timing of given phase
+        """
+        with self.lock:
+            observed = self.phases.setdefault(phase, [0.0, 0])
+            observed[0] += seconds
+            observed[1] += 1
+        if self.statsd_socket is not None:
+            metric = "%s.phase.%s:%.3f|ms" % (self.prefix, phase,
+                                              seconds * 1000)
+            try:
+                self.statsd_socket.sendto(metric.encode("utf-8"),
+                                          self.statsd_address)
+            except socket.error:
+                # metrics must never fail the scan
+                pass
+
+    def observe_timings(self, timings):
+        """
+        Record the phase timings dict of a scan
+        """
+        for phase, seconds in timings.items():
+            self.observe(phase, seconds)
+
+    def write_textfile(self):
+        """
+        Atomically write the Prometheus textfile with observed timings
+        """
+        name = self.prefix + "_phase_seconds"
+        lines = [
+            "# HELP %s Time spent in phases of container scans." % name,
+            "# TYPE %s summary" % name,
+        ]
+        with self.lock:
+            for phase, (total, count) in self.phases.items():
+                lines.append('%s_sum{phase="%s"} %f' % (name, phase, total))
+                lines.append('%s_count{phase="%s"} %d' % (name, phase, count))
+        endpoints = server_ring_stats()
+        if endpoints:
+            name = self.prefix + "_server_seconds"
+            lines.append("# HELP %s Time spent in calls per server end "
+                         "point." % name)
+            lines.append("# TYPE %s summary" % name)
+            for endpoint, stats in endpoints.items():
+                lines.append('%s_sum{endpoint="%s"} %f' %
+                             (name, endpoint, stats["latency_sum"]))
+                lines.append('%s_count{endpoint="%s"} %d' %
+                             (name, endpoint, stats["requests"]))
+        tmp_path = self.textfile_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.rename(tmp_path, self.textfile_path)
+
+    def close(self):
+        if self.textfile_path:
+            self.write_textfile()
+        if self.statsd_socket is not None:
+            self.statsd_socket.close()
+
+
+class RunSummary(object):
+    """
+    Summary of a scanner run, aggregated incrementally as the scans
+    complete: totals of successful and failed scans per error class,
+    histogram of server call latencies, cache hit rates, bytes of results
+    written and the slowest containers.
+
+    The summary is written atomically as JSON to path when closed.
+    """
+
+    # upper bounds in seconds of server call latency histogram buckets
+    latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                       5.0, 10.0)
+    # phases of scan making server calls
+    server_phases = ("server_request", "error_report")
+
+    def __init__(self, path, slowest=10):
+        self.path = path
+        self.slowest_size = slowest
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.start = monotonic_time()
+        self.containers = 0
+        self.successful = 0
+        self.reused = 0
+        self.errors = {}
+        self.bytes_written = 0
+        self.server = {"requests": 0, "retries": 0, "queued": 0,
+                       "not_modified": 0, "coalesced": 0}
+        self.latency_counts = [0] * (len(self.latency_buckets) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.latency_max = 0.0
+        self.cache_hits = 0
+        self.cache_lookups = 0
+        # min heap of (latency, container) of the slowest containers
+        self.slowest = []
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns RunSummary configured with env variables, None if the run
+        summary is not configured
+        """
+        path = os.environ.get("RUN_SUMMARY", "").strip()
+        if not path:
+            return None
+        return cls(path, slowest=get_env_int("RUN_SUMMARY_SLOWEST",
+                                             default=10, minimum=0))
+
+    def observe(self, container, status, output, latency, bytes_written=0):
+        """
+        Add the result of a scan of container to summary
+        """
+        import bisect
+        import heapq
+        # results reused from a previous run carry the server calls and
+        # phase timings of that run, which are not counted
+        reused = bool(output.get("Incremental"))
+        timings = {} if reused else output.get("Phase Timings", {})
+        server_requests = {} if reused else output.get("Server Requests", {})
+        registration_cache = {} if reused else output.get("Scan Results", {})
+        if isinstance(registration_cache, dict):
+            registration_cache = registration_cache.get("registration_cache")
+        with self.lock:
+            self.containers += 1
+            self.bytes_written += bytes_written
+            if reused:
+                self.reused += 1
+            if status:
+                self.successful += 1
+            else:
+                error_class = output.get("Error Class", "unknown")
+                self.errors[error_class] = self.errors.get(error_class, 0) + 1
+
+            for phase in self.server_phases:
+                if phase not in timings:
+                    continue
+                seconds = timings[phase]
+                self.latency_counts[bisect.bisect_left(
+                    self.latency_buckets, seconds)] += 1
+                self.latency_sum += seconds
+                self.latency_count += 1
+                self.latency_max = max(self.latency_max, seconds)
+            for key in self.server:
+                self.server[key] += server_requests.get(key, 0)
+            if registration_cache:
+                self.cache_lookups += 1
+                self.cache_hits += 1 if registration_cache.get("hit") else 0
+
+            if self.slowest_size:
+                entry = (latency, container)
+                if len(self.slowest) < self.slowest_size:
+                    heapq.heappush(self.slowest, entry)
+                elif entry > self.slowest[0]:
+                    heapq.heapreplace(self.slowest, entry)
+
+    def to_dict(self, discovery=None, manifest=None):
+        """
+        Returns the summary as dict, with given discovery counts of
+        Scanner and counts of ScanManifest if any
+        """
+        with self.lock:
+            buckets = OrderedDict()
+            for bound, count in zip(self.latency_buckets + ("+Inf",),
+                                    self.latency_counts):
+                buckets[str(bound)] = count
+            summary = OrderedDict([
+                ("Started", self.started),
+                ("Duration", round(monotonic_time() - self.start, 6)),
+                ("Containers", self.containers),
+                ("Successful", self.successful),
+                ("Failed", self.containers - self.successful),
+                ("Errors", dict(self.errors)),
+                ("Bytes Written", self.bytes_written),
+                ("Server Requests", dict(self.server)),
+                ("Server Latency", OrderedDict([
+                    ("count", self.latency_count),
+                    ("sum", round(self.latency_sum, 6)),
+                    ("max", round(self.latency_max, 6)),
+                    ("buckets", buckets),
+                ])),
+                ("Registration Cache", {
+                    "lookups": self.cache_lookups,
+                    "hits": self.cache_hits,
+                    "hit_rate": (round(float(self.cache_hits) /
+                                       self.cache_lookups, 4)
+                                 if self.cache_lookups else None),
+                }),
+                ("Incremental", {
+                    "reused": self.reused,
+                    "reuse_rate": (round(float(self.reused) /
+                                         self.containers, 4)
+                                   if self.containers else None),
+                }),
+                ("Slowest", [{"container": container,
+                              "seconds": round(latency, 6)}
+                             for latency, container in
+                             sorted(self.slowest, reverse=True)]),
+            ])
+        endpoints = server_ring_stats()
+        if endpoints:
+            summary["Endpoints"] = endpoints
+        if discovery:
+            summary["Discovery"] = discovery
+        if manifest is not None:
+            summary["Incremental"]["manifest"] = {
+                "reused": manifest.reused, "scanned": manifest.scanned}
+        return summary
+
+    def write(self, discovery=None, manifest=None):
+        """
+        Atomically write the summary to path
+        """
+        summary = self.to_dict(discovery, manifest)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(summary, f, indent=4, separators=(",", ": "))
+        os.rename(tmp_path, self.path)
+
+
+def get_results_output(env_name="RESULTS_OUTPUT"):
+    """
+    Gets how the scan results are exported, one of
+    directory, ndjson or both
+    """
+    value = os.environ.get(env_name, "").strip() or "directory"
+    if value not in ("directory", "ndjson", "both"):
+        raise ValueError(
+            "Invalid value %s for %s env variable, valid values are: "
+            "directory, ndjson, both" % (value, env_name))
+    return value
+
+
+def get_output_format(env_name="OUTPUT_FORMAT"):
+    """
+    Gets the format of exported result files, one of
+    pretty, compact or msgpack
+    """
+    value = os.environ.get(env_name, "").strip() or "pretty"
+    if value not in ("pretty", "compact", "msgpack"):
+        raise ValueError(
+            "Invalid value %s for %s env variable, valid values are: "
+            "pretty, compact, msgpack" % (value, env_name))
+    if value == "msgpack":
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            raise ValueError(
+                "%s=msgpack needs msgpack python module installed" %
+                env_name)
+    return value
+
+
+def serialize_result(output, output_format):
+    """
+    Serialize the scan output in given format, returns bytes
+    """
+    if output_format == "msgpack":
+        import msgpack
+        return msgpack.packb(output, use_bin_type=True)
+    if output_format == "compact":
+        data = json.dumps(output, separators=(",", ":"))
+    else:
+        data = json.dumps(output, indent=4, separators=(",", ": "))
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return data
+
+
+def deserialize_result(data, output_format):
+    """
+    Returns the scan output serialized in given format by serialize_result
+    """
+    if output_format == "msgpack":
+        import msgpack
+        return msgpack.unpackb(data, raw=False,
+                               object_pairs_hook=OrderedDict)
+    return json.loads(data.decode("utf-8"), object_pairs_hook=OrderedDict)
+
+
+def get_results_ndjson_path(env_name="RESULTS_NDJSON_PATH"):
+    """
+    Gets the path of NDJSON results file, "-" for stdout
+    """
+    return (os.environ.get(env_name, "").strip() or
+            os.path.join(OUTDIR, "analytics_scanner_results.ndjson"))
+
+
+class NDJSONResultSink(object):
+    """
+    Streams scan results as compact newline delimited JSON records, one
+    record per container, to a single buffered file or to stdout.
+
+    The file is fsync'ed after every fsync_interval records and on close.
+    """
+
+    def __init__(self, path, fsync_interval=100):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self.lock = threading.Lock()
+        if path == "-":
+            self.stream = getattr(sys.stdout, "buffer", sys.stdout)
+        else:
+            self.stream = open(path, "ab")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns NDJSONResultSink configured with env variables
+        """
+        return cls(get_results_ndjson_path(),
+                   fsync_interval=get_env_int("RESULTS_FSYNC_INTERVAL",
+                                              default=100, minimum=1))
+
+    def write(self, output):
+        """
+        Write the scan output as one record
+        """
+        self.write_record(serialize_result(output, "compact"))
+
+    def write_record(self, data):
+        """
+        Write the scan output serialized as compact JSON as one record
+        """
+        record = data + b"\n"
+        with self.lock:
+            self.stream.write(record)
+            self.records += 1
+            if self.records % self.fsync_interval == 0:
+                self.sync()
+
+    def sync(self):
+        self.stream.flush()
+        if self.path != "-":
+            os.fsync(self.stream.fileno())
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            if self.path != "-":
+                self.stream.close()
+
+
+class ScanManifest(object):
+    """
+    Manifest of the successful scans of previous runs, kept on the output
+    volume for incremental rescans.
+
+    Each entry is keyed by container, i.e. the image uuid atomic mounts the
+    image as, and holds the label fingerprint, scan result and time of the
+    scan. A container with an entry younger than max_age seconds for same
+    scan type, and with same label fingerprint, is not scanned again, its
+    previous result is reused.
+    """
+
+    def __init__(self, path, max_age=86400):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.reused = 0
+        self.scanned = 0
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.entries = json.load(f).get("entries", {})
+
+    @classmethod
+    def from_env(cls, env_name="SCAN_MANIFEST"):
+        """
+        Returns ScanManifest at path in env variable, None if not set
+        """
+        path = os.environ.get(env_name, "").strip()
+        if not path:
+            return None
+        return cls(path, max_age=get_env_int("SCAN_MANIFEST_MAX_AGE",
+                                             default=86400, minimum=0))
+
+    def is_fresh(self, entry, now=None):
+        return (now or time.time()) - entry["timestamp"] <= self.max_age
+
+    def previous_entry(self, container, scan_type):
+        """
+        Returns the entry of previous scan of container with scan_type, if
+        fresh, else None
+        """
+        with self.lock:
+            entry = self.entries.get(container)
+            if (entry is None or entry["scan_type"] != scan_type or
+                    not self.is_fresh(entry)):
+                return None
+            return entry
+
+    def previous_result(self, container, scan_type, fingerprint=None):
+        """
+        Returns the result of previous scan of container to be reused, None
+        if container needs to be scanned, i.e. it has no fresh entry, or
+        the label fingerprint of entry is not the given one
+        """
+        with self.lock:
+            entry = self.entries.get(container)
+            if (entry is None or entry["scan_type"] != scan_type or
+                    not self.is_fresh(entry)):
+                return None
+            if (fingerprint is not None and
+                    entry.get("label_fingerprint") != fingerprint):
+                return None
+            self.reused += 1
+            output = json.loads(json.dumps(entry["result"]))
+        output["Incremental"] = {
+            "Reused": True,
+            "Previous Finished Time": output.get("Finished Time"),
+        }
+        return output
+
+    def record(self, container, scan_type, status, output):
+        """
+        Record the result of scan of container, only successful scans are
+        recorded, to be reused by later runs
+        """
+        with self.lock:
+            self.scanned += 1
+            if not status:
+                self.entries.pop(container, None)
+                return
+            self.entries[container] = {
+                "image_id": container,
+                "label_fingerprint": output.get("Label Fingerprint"),
+                "scan_type": scan_type,
+                "result": output,
+                "timestamp": time.time(),
+            }
+
+    def save(self):
+        """
+        Atomically write the manifest, dropping the stale entries
+        """
+        now = time.time()
+        with self.lock:
+            entries = dict((container, entry) for container, entry in
+                           self.entries.items() if self.is_fresh(entry, now))
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"version": 1, "entries": entries}, f)
+            os.rename(tmp_path, self.path)
+
+
+def scan_directory(path):
+    """
+    Returns (name, is_dir) for the entries of directory at path.
+
+    Uses os.scandir (or scandir backport on python2, if installed), which
+    reads the entry types along with names, instead of a stat call per
+    entry.
+    """
+    scandir = getattr(os, "scandir", None)
+    if scandir is None:
+        try:
+            from scandir import scandir
+        except ImportError:
+            return [(name, os.path.isdir(os.path.join(path, name)))
+                    for name in os.listdir(path)]
+    return [(entry.name, entry.is_dir()) for entry in scandir(path)]
+
+
+def bounded_imap(pool, func, items, window):
+    """
+    Yields func(item) for given items in the same order as items, running
+    the calls on pool.
+
+    Unlike pool.imap, at most window calls are run ahead of the results
+    consumed, so that results of fast calls, e.g. large scan reports, don't
+    pile up in memory while the consumer is busy exporting.
+    """
+    from collections import deque
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def get_scan_engine(env_name="SCAN_ENGINE"):
+    """
+    Gets the engine to run the container scans with, pool or pipeline
+    """
+    value = os.environ.get(env_name, "").strip() or "pool"
+    if value not in ("pool", "pipeline"):
+        raise ValueError(
+            "Invalid value %s for %s env variable, valid values are: "
+            "pool, pipeline" % (value, env_name))
+    return value
+
+
+def get_scan_concurrency(env_name="SCAN_CONCURRENCY"):
+    """
+    Gets the number of server calls pipeline engine keeps in flight
+    """
+    return get_env_int(env_name, default=100, minimum=1)
+
+
+def get_daemon_socket_path(env_name="SCANNER_SOCKET"):
+    """
+    Gets the path of Unix socket scanner daemon listens on, None if not set
+    """
+    return os.environ.get(env_name, "").strip() or None
+
+
+def request_daemon_scan(socket_path, job, timeout=None):
+    """
+    Send the scan job to scanner daemon listening on socket_path
+
+    :param socket_path: Path of Unix socket scanner daemon listens on
+    :param job: Dict with scan_type, container, image_name and server_url
+    :param timeout: Seconds to wait for daemon, None to wait forever
+
+    :return: Tuple (status, output) of the scan run by daemon
+    :raises: socket.error, ValueError
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        stream = sock.makefile("rb")
+        try:
+            line = stream.readline()
+        finally:
+            stream.close()
+    finally:
+        sock.close()
+    if not line:
+        raise ValueError("Scanner daemon closed connection without result.")
+    result = json.loads(line.decode("utf-8"))
+    return result["status"], result["output"]
+
+
+class ScanJob(object):
+    """
+    A scan job queued in scanner daemon, holds the result once it is run
+    """
+
+    def __init__(self, scan_type, container, image_name, server_url):
+        self.scan_type = scan_type
+        self.container = container
+        self.image_name = image_name
+        self.server_url = server_url
+        self.result = None
+        self.done = threading.Event()
+
+    def set_result(self, status, output):
+        self.result = (status, output)
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        return self.result
+
+
+class ScanRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads newline delimited JSON scan jobs from a scanner daemon client and
+    writes one JSON line {"status": .., "output": ..} back per job
+    """
+
+    def handle(self):
+        service = self.server.service
+        for line in iter(self.rfile.readline, b""):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode("utf-8"))
+                job = service.submit(ScanJob(
+                    scan_type=request.get("scan_type", "register"),
+                    container=request.get("container", ""),
+                    image_name=request.get("image_name"),
+                    server_url=request.get("server_url")))
+                status, output = job.wait()
+            except Exception as e:
+                status, output = False, {"Summary": "Error: %s" % str(e)}
+            self.wfile.write(
+                (json.dumps({"status": status, "output": output}) +
+                 "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class ScanService(object):
+    """
+    Resident scanner daemon, runs the scan jobs received over a Unix socket
+    from an internal queue.
+
+    The HTTP session, label source and registration cache stay warm across
+    jobs, instead of being set up again by a new process for every scan.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or get_scan_workers()
+        self.jobs = queue.Queue()
+        self.registration_cache = RegistrationCache.from_env()
+        self.label_source = LabelSource.from_env()
+        self.report_cache = ReportCache.from_env()
+        self.outbox = Outbox.from_env()
+        self.threads = []
+        self.server = None
+
+    def start(self):
+        """
+        Start the worker threads running queued jobs
+        """
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        if self.outbox is not None:
+            # drain the outbox in background once server is back
+            thread = threading.Thread(
+                target=self.outbox.drain,
+                args=(get_env_float("OUTBOX_REPLAY_INTERVAL", default=60.0),))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, job):
+        """
+        Queue the ScanJob, returns it for waiting on its result
+        """
+        self.jobs.put(job)
+        return job
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                job.set_result(*self.run_job(job))
+            except Exception as e:
+                job.set_result(False, {"Summary": "Error: %s" % str(e)})
+            finally:
+                self.jobs.task_done()
+
+    def run_job(self, job):
+        """
+        Run the scan for given ScanJob, returns (status, output)
+        """
+        per_scan_object = AnalyticsIntegration(
+            job.container, job.scan_type,
+            registration_cache=self.registration_cache,
+            label_source=self.label_source,
+            image_name=job.image_name,
+            server_url=job.server_url,
+            report_cache=self.report_cache,
+            outbox=self.outbox)
+        return per_scan_object.run()
+
+    def serve(self, socket_path):
+        """
+        Listen for scan jobs on Unix socket at socket_path, until killed
+        """
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.start()
+        self.server = socketserver.ThreadingUnixStreamServer(
+            socket_path, ScanRequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        logging.getLogger("integration-scanner").info(
+            "Scanner daemon listening on %s with %d worker(s).",
+            socket_path, self.workers)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.unlink(socket_path)
 
 
 class Scanner(object):
@@ -345,48 +3387,632 @@ class Scanner(object):
     Wrapper class for running the scan over images and/or containers
     """
 
-    def __init__(self, scan_type):
+    def __init__(self, scan_type, workers=None, batch_size=None):
         self.scan_type = scan_type
         self.scanner = "scanner-analytics-integration"
-        self.result_file = "analytics_scanner_results.json"
+        # pretty, compact or msgpack
+        self.output_format = get_output_format()
+        if self.output_format == "msgpack":
+            self.result_file = "analytics_scanner_results.msgpack"
+        else:
+            self.result_file = "analytics_scanner_results.json"
+        # number of containers to be scanned concurrently
+        self.workers = workers or get_scan_workers()
+        # number of registrations to be sent in one bulk POST call
+        self.batch_size = batch_size or get_register_batch_size()
+        # pool runs each scan start to end on one of self.workers threads,
+        # pipeline fetches labels on self.workers threads and keeps up to
+        # self.concurrency server calls in flight on separate threads
+        self.engine = get_scan_engine()
+        self.concurrency = get_scan_concurrency()
+        # on disk cache of registration responses, if configured
+        self.registration_cache = RegistrationCache.from_env()
+        # source of image labels, shared by containers of same image
+        self.label_source = LabelSource.from_env()
+        # on disk cache of fetched reports, if configured
+        self.report_cache = ReportCache.from_env()
+        # on disk outbox of undelivered server calls, if configured
+        self.outbox = Outbox.from_env()
+        # emitter for phase timings of scans, if configured
+        self.metrics = MetricsEmitter.from_env()
+        # run level summary of scans, if configured
+        self.summary = RunSummary.from_env()
+        # scanner daemon to hand the scans over to, if running
+        self.daemon_socket = get_daemon_socket_path()
+        # manifest of previous scans for incremental rescans, if configured
+        self.manifest = ScanManifest.from_env()
+        # directory, ndjson or both
+        self.results_output = get_results_output()
+        self.result_sink = None
+        # counts of /scanin entries found and rejected by target_containers
+        self.discovery = {}
 
     def target_containers(self):
         """
-        Returns the containers / images to be processed
+        Returns the containers / images to be processed.
+
+        Hidden entries and entries which are not directories are rejected
+        right away, the remaining ones are checked with check_target on
+        up to self.workers threads. Counts are kept in self.discovery.
         """
+        start = monotonic_time()
         # atomic scan will mount container's image onto
         # a rootfs and expose rootfs to scanner under the /scanin directory
-        return [_dir for _dir in os.listdir(INDIR) if
-                os.path.isdir(os.path.join(INDIR, _dir))
-                ]
+        entries = scan_directory(INDIR)
+        rejected = {}
+        candidates = []
+        for name, is_dir in entries:
+            if name.startswith("."):
+                reason = "hidden"
+            elif not is_dir:
+                reason = "not_directory"
+            else:
+                candidates.append(name)
+                continue
+            rejected[reason] = rejected.get(reason, 0) + 1
+
+        # sorted, so that the processing order is same for every run
+        candidates.sort()
+        targets = []
+        logger = logging.getLogger("integration-scanner")
+        for container, reason in zip(candidates,
+                                     self.map(self.check_target, candidates)):
+            if reason is None:
+                targets.append(container)
+                continue
+            logger.info("Skipping %s: %s.", container, reason)
+            rejected[reason] = rejected.get(reason, 0) + 1
+
+        self.discovery = {
+            "entries": len(entries),
+            "targets": len(targets),
+            "rejected": rejected,
+            "seconds": round(monotonic_time() - start, 6),
+        }
+        return targets
 
-    def run(self):
-        for container in self.target_containers():
+    def check_target(self, container):
+        """
+        Returns the reason for rejecting container before scanning it,
+        None if it is to be scanned
+        """
+        path = os.path.join(INDIR, container)
+        if not os.access(path, os.R_OK | os.X_OK):
+            return "unreadable"
+        # results are exported in a new directory per container
+        if (self.results_output != "ndjson" and
+                os.path.exists(os.path.join(OUTDIR, container))):
+            return "exported"
+        return None
+
+    def scan_container(self, container):
+        """
+        Scans given container and returns (status, output, latency)
+        """
+        start = monotonic_time()
+        if self.daemon_socket:
+            result = self.scan_container_remote(container)
+            if result is not None:
+                return result + (monotonic_time() - start,)
+
+        per_scan_object = AnalyticsIntegration(
+            container, self.scan_type,
+            registration_cache=self.registration_cache,
+            label_source=self.label_source,
+            report_cache=self.report_cache,
+            outbox=self.outbox)
+        status, output = per_scan_object.run()
+        return status, output, monotonic_time() - start
+
+    def scan_container_remote(self, container):
+        """
+        Hands the scan of given container over to scanner daemon, returns
+        (status, output), or None if the container needs to be scanned
+        locally
+        """
+        try:
+            image_name = get_image_name()
+            server_url = get_server_url()
+        except ValueError:
+            # local scan fails fast, reporting missing inputs as usual
+            return None
+
+        job = {"scan_type": self.scan_type, "container": container,
+               "image_name": image_name, "server_url": server_url}
+        try:
+            return request_daemon_scan(self.daemon_socket, job)
+        except (socket.error, ValueError, KeyError) as e:
+            logging.getLogger("integration-scanner").warning(
+                "Could not run scan via scanner daemon at %s, scanning "
+                "locally. Error: %s", self.daemon_socket, e)
+            return None
+
+    def map(self, func, items):
+        """
+        Yields func(item) for given items in the same order as items,
+        running up to self.workers calls concurrently.
+        """
+        workers = min(self.workers, len(items))
+        if workers <= 1:
+            for item in items:
+                yield func(item)
+            return
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            # results are yielded in input order irrespective of which call
+            # finishes first, this keeps output and exit status deterministic
+            for result in bounded_imap(pool, func, items, 2 * workers):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def scan_containers(self, containers):
+        """
+        Yields (container, status, output, latency) for given containers,
+        in the same order as containers.
 
-            per_scan_object = AnalyticsIntegration(container, self.scan_type)
-            status, output = per_scan_object.run()
-            print ("Scanner execution status: %s" % status)
+        With a scan manifest, containers scanned successfully by a recent
+        run are not scanned again, their previous results are reused.
+        """
+        if self.manifest is None:
+            for result in self.scan_changed_containers(containers):
+                yield result
+            return
+
+        # the labels of containers with a fresh entry are read, to check
+        # they are not changed since, without server calls
+        candidates = [c for c in containers if self.manifest.previous_entry(
+            c, self.scan_type) is not None]
+        previous = {}
+        for container, fingerprint in zip(
+                candidates, self.map(self.label_fingerprint, candidates)):
+            if fingerprint is None:
+                continue
+            output = self.manifest.previous_result(container, self.scan_type,
+                                                   fingerprint)
+            if output is not None:
+                previous[container] = output
+        changed = [c for c in containers if c not in previous]
+
+        results = self.scan_changed_containers(changed)
+        for container in containers:
+            if container in previous:
+                yield container, True, previous[container], 0.0
+                continue
+            result = next(results)
+            self.manifest.record(container, self.scan_type, result[1],
+                                 result[2])
+            yield result
+
+    def label_fingerprint(self, container):
+        """
+        Returns the label fingerprint a scan of container would record,
+        None if the labels of container can not be read
+        """
+        try:
+            # docker inspects images by uuid as well as by name
+            _, labels = self.label_source.get_labels(container, container)
+            return label_fingerprint(dict(
+                (name, labels[name].strip())
+                for name in AnalyticsIntegration.needed_labels
+                if labels.get(name)))
+        except Exception:
+            return None
+
+    def scan_changed_containers(self, containers):
+        """
+        Yields (container, status, output, latency) for given containers,
+        in the same order as containers, scanning every one of them.
+        """
+        if containers and not self.daemon_socket:
+            # pool a connection for every server call made concurrently
+            if self.engine == "pipeline":
+                get_http_session(min(self.concurrency, len(containers)))
+            else:
+                get_http_session(min(self.workers, len(containers)))
+
+        # only registrations are batched, scans handed over to scanner
+        # daemon are not batched
+        if (self.batch_size > 1 and not self.daemon_socket and
+                self.scan_type != "get_report"):
+            for result in self.scan_containers_batched(containers):
+                yield result
+            return
+
+        if self.engine == "pipeline" and not self.daemon_socket:
+            for result in self.scan_containers_pipelined(containers):
+                yield result
+            return
+
+        # not zipped with containers, as zip() consumes the results up front
+        # on python2
+        results = self.map(self.scan_container, containers)
+        for container in containers:
+            yield (container,) + next(results)
+
+    def scan_containers_pipelined(self, containers):
+        """
+        Same as scan_containers, but the label fetching and server call
+        stages of scans run on separate thread pools. Labels are fetched on
+        self.workers threads while up to self.concurrency server calls are
+        in flight, so slow server responses do not hold up label fetching
+        of remaining containers.
+
+        At most self.concurrency scans are run ahead of the results
+        consumed, as with bounded_imap, so that results don't pile up in
+        memory while the consumer is busy exporting or the oldest scan is
+        slow.
+        """
+        from collections import deque
+        from multiprocessing.pool import ThreadPool
+
+        scan_type = self.scan_type
+        registration_cache = self.registration_cache
+        label_source = self.label_source
+        report_cache = self.report_cache
+        outbox = self.outbox
+
+        def prepare(container):
+            start = monotonic_time()
+            per_scan_object = AnalyticsIntegration(
+                container, scan_type,
+                registration_cache=registration_cache,
+                label_source=label_source,
+                report_cache=report_cache,
+                outbox=outbox)
+            return container, per_scan_object, per_scan_object.prepare(), start
+
+        label_workers = max(1, min(self.workers, len(containers)))
+        concurrency = max(1, min(self.concurrency, len(containers)))
+        label_pool = ThreadPool(label_workers)
+        server_pool = ThreadPool(concurrency)
+        # (container, async result of server call, failure, start) of scans
+        # in order of containers, yielded as soon as head of queue is done
+        in_flight = deque()
+        try:
+            for container, per_scan_object, failure, start in bounded_imap(
+                    label_pool, prepare, containers, 2 * label_workers):
+                # wait for the oldest scan once concurrency scans are in
+                # flight
+                if len(in_flight) >= concurrency:
+                    yield self._pipelined_result(in_flight.popleft())
+
+                if failure is None:
+                    in_flight.append((container, server_pool.apply_async(
+                        per_scan_object.call_server), None, start))
+                else:
+                    in_flight.append((container, None, failure, start))
+
+                while in_flight and (in_flight[0][1] is None or
+                                     in_flight[0][1].ready()):
+                    yield self._pipelined_result(in_flight.popleft())
+
+            while in_flight:
+                yield self._pipelined_result(in_flight.popleft())
+        finally:
+            for pool in (label_pool, server_pool):
+                pool.close()
+                pool.join()
+
+    def _pipelined_result(self, scan):
+        container, async_result, failure, start = scan
+        if async_result is not None:
+            failure = async_result.get()
+        status, output = failure
+        return container, status, output, monotonic_time() - start
+
+    def scan_containers_batched(self, containers):
+        """
+        Same as scan_containers, but the registrations of containers are
+        sent to server in bulk POST calls of self.batch_size registrations
+        """
+        scan_type = self.scan_type
+        registration_cache = self.registration_cache
+        label_source = self.label_source
+        outbox = self.outbox
+        batcher = RegistrationBatcher(
+            api=get_server_api(scan_type),
+            bulk_api=get_register_bulk_api(),
+            batch_size=self.batch_size,
+            flush_interval=get_register_flush_interval())
+
+        def prepare(container):
+            start = monotonic_time()
+            per_scan_object = AnalyticsIntegration(
+                container, scan_type,
+                registration_cache=registration_cache,
+                label_source=label_source,
+                outbox=outbox)
+            failure = per_scan_object.prepare()
+            if failure is not None:
+                return per_scan_object, None, failure, start
+            resp = per_scan_object.cached_response()
+            if resp is not None:
+                return (per_scan_object, None,
+                        per_scan_object.process_response(True, resp), start)
+            request = batcher.submit(per_scan_object.server_url,
+                                     per_scan_object.server_api(),
+                                     per_scan_object.recorded_labels,
+                                     stats=per_scan_object.server_stats)
+            return per_scan_object, request, None, start
+
+        prepared = list(self.map(prepare, containers))
+        # send the last partially filled batch right away
+        batcher.flush()
+
+        for container, (per_scan_object, request, failure, start) in zip(
+                containers, prepared):
+            if failure is None:
+                status, resp = request.wait()
+                per_scan_object.timings.add("server_request", request.latency)
+                failure = per_scan_object.process_response(status, resp)
+            status, output = failure
+            yield container, status, output, monotonic_time() - start
 
-            # Write scan results to json file
-            out_path = os.path.join(OUTDIR, container)
-            self.export_results(out_path, output, container)
+    def run(self):
+        """
+        Scans all the target containers and exports the results,
+        returns True if all the scans were successful
+        """
+        logger = logging.getLogger("integration-scanner")
+        containers = self.target_containers()
+        logger.info("Discovered %d target(s) in %d entries of %s in %.3f "
+                    "seconds, rejected: %s.", self.discovery["targets"],
+                    self.discovery["entries"], INDIR,
+                    self.discovery["seconds"],
+                    self.discovery["rejected"] or "none")
+        start = monotonic_time()
+        overall_status = True
+
+        if self.results_output in ("ndjson", "both"):
+            self.result_sink = NDJSONResultSink.from_env()
+        # keep stdout for NDJSON records alone, if written there
+        status_stream = sys.stdout
+        if self.result_sink is not None and self.result_sink.path == "-":
+            status_stream = sys.stderr
+        try:
+            for container, status, output, latency in self.scan_containers(
+                    containers):
+                status_stream.write("Scanner execution status: %s\n" % status)
+                logger.info("Scanned %s in %.3f seconds.", container, latency)
+                overall_status = overall_status and status
+
+                # Write scan results to json file
+                out_path = os.path.join(OUTDIR, container)
+                export_start = monotonic_time()
+                written = self.export_results(out_path, output, container)
+                if self.summary is not None:
+                    self.summary.observe(container, status, output, latency,
+                                         written)
+                if self.metrics is not None:
+                    # reused results were timed by a previous run
+                    if not output.get("Incremental"):
+                        self.metrics.observe_timings(
+                            output.get("Phase Timings", {}))
+                    self.metrics.observe("export_results",
+                                         monotonic_time() - export_start)
+        finally:
+            if self.result_sink is not None:
+                self.result_sink.close()
+            if self.manifest is not None:
+                self.manifest.save()
+            if self.metrics is not None:
+                self.metrics.close()
+            if self.summary is not None:
+                self.summary.write(self.discovery, self.manifest)
+
+        logger.info("Scanned %d container(s) in %.3f seconds using %d "
+                    "worker(s).", len(containers), monotonic_time() - start,
+                    self.workers_used(containers))
+        if self.registration_cache is not None:
+            logger.info("Registration cache: %(hits)d hit(s), %(misses)d "
+                        "miss(es).", self.registration_cache.stats())
+        if self.manifest is not None:
+            logger.info("Incremental scan: reused %d previous result(s), "
+                        "scanned %d container(s).", self.manifest.reused,
+                        self.manifest.scanned)
+        return overall_status
+
+    def workers_used(self, containers):
+        """
+        Returns the number of workers used for scanning given containers
+        """
+        return min(self.workers, max(len(containers), 1))
 
     def export_results(self, out_path, output, container):
         """
-        Export the JSON data in output_file
+        Export the JSON data in output_file and/or NDJSON result sink,
+        serializing it once if both take the same format.
+
+        :return: Number of bytes written
         """
+        data = None
+        written = 0
+        if self.result_sink is not None:
+            data = serialize_result(output, "compact")
+            self.result_sink.write_record(data)
+            written += len(data) + 1
+        if self.results_output == "ndjson":
+            return written
+        if data is None or self.output_format != "compact":
+            data = serialize_result(output, self.output_format)
+
         out_path = os.path.join(OUTDIR, container)
         os.makedirs(out_path)
 
         # result file name = "scanner-analytics-integration.json"
         result_filename = os.path.join(out_path, self.result_file)
 
-        with open(result_filename, "w") as f:
-            json.dump(output, f, indent=4, separators=(",", ": "))
+        with open(result_filename, "wb") as f:
+            f.write(data)
+        return written + len(data)
+
+
+def read_image_list(path):
+    """
+    Returns the image names listed one per line in file at path, or on
+    stdin if path is "-". Blank lines and lines starting with # are
+    skipped.
+    """
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as f:
+            lines = f.readlines()
+    return [line.strip() for line in lines
+            if line.strip() and not line.strip().startswith("#")]
+
+
+def get_bulk_processes(env_name="BULK_PROCESSES"):
+    """
+    Gets the number of processes scanning the images of bulk scan
+    """
+    import multiprocessing
+    return get_env_int(env_name, default=multiprocessing.cpu_count(),
+                       minimum=1)
+
+
+# label source and caches of a bulk scan worker process,
+# set up once per process by init_bulk_worker
+_bulk_worker = {}
+
+
+def init_bulk_worker():
+    """
+    Set up the logging, label source and caches of bulk scan worker process
+    """
+    # logging listener threads of parent are not running in forked process
+    for name in reset_logging():
+        configure_logging(name)
+    _bulk_worker["registration_cache"] = RegistrationCache.from_env()
+    _bulk_worker["label_source"] = LabelSource.from_env()
+    _bulk_worker["report_cache"] = ReportCache.from_env()
+    _bulk_worker["outbox"] = Outbox.from_env()
+
+
+def scan_image(job):
+    """
+    Scans the image of given (scan_type, uuid, image_name) job in a bulk
+    scan worker process, returns (uuid, status, output, latency)
+    """
+    scan_type, uuid, image_name = job
+    start = monotonic_time()
+    per_scan_object = AnalyticsIntegration(
+        uuid, scan_type,
+        registration_cache=_bulk_worker.get("registration_cache"),
+        label_source=_bulk_worker.get("label_source"),
+        image_name=image_name,
+        report_cache=_bulk_worker.get("report_cache"),
+        outbox=_bulk_worker.get("outbox"))
+    status, output = per_scan_object.run()
+    return uuid, status, output, monotonic_time() - start
+
+
+class BulkScanner(Scanner):
+    """
+    Scanner for a list of image names instead of the images mounted under
+    /scanin, e.g. for registering all the images of a node at once.
+
+    Images are deduplicated by image uuid and scanned on a pool of
+    self.processes processes, results are exported into the usual
+    /scanout/<uuid> layout as they come in.
+    """
+
+    def __init__(self, scan_type, image_names, processes=None):
+        Scanner.__init__(self, scan_type)
+        self.image_names = image_names
+        self.processes = processes or get_bulk_processes()
+        # image uuid -> name of image to be scanned
+        self.images = {}
+
+    def target_containers(self):
+        """
+        Returns the uuids of images to be scanned, resolving the image
+        names via docker daemon and dropping the duplicate images.
+        """
+        start = monotonic_time()
+        client = connect_local_docker_socket()
+        logger = logging.getLogger("integration-scanner")
+
+        def resolve(image_name):
+            try:
+                return get_image_uuid(client, image_name)
+            except Exception as e:
+                logger.error("Could not resolve image %s: %s", image_name, e)
+                return None
+
+        rejected = {}
+        for image_name, uuid in zip(self.image_names,
+                                    self.map(resolve, self.image_names)):
+            if uuid is None:
+                reason = "unresolved"
+            elif uuid in self.images:
+                reason = "duplicate"
+            elif (self.results_output != "ndjson" and
+                    os.path.exists(os.path.join(OUTDIR, uuid))):
+                reason = "exported"
+            else:
+                self.images[uuid] = image_name
+                continue
+            rejected[reason] = rejected.get(reason, 0) + 1
+
+        self.discovery = {
+            "entries": len(self.image_names),
+            "targets": len(self.images),
+            "rejected": rejected,
+            "seconds": round(monotonic_time() - start, 6),
+        }
+        return sorted(self.images)
+
+    def workers_used(self, containers):
+        return min(self.processes, max(len(containers), 1))
+
+    def scan_changed_containers(self, containers):
+        """
+        Yields (uuid, status, output, latency) for given image uuids, in
+        the same order as containers, scanning them on the process pool.
+        """
+        if not containers:
+            return
+        from multiprocessing import Pool
+        jobs = [(self.scan_type, uuid, self.images[uuid])
+                for uuid in containers]
+        processes = min(self.processes, len(jobs))
+        pool = Pool(processes, initializer=init_bulk_worker)
+        try:
+            for result in bounded_imap(pool, scan_image, jobs,
+                                       2 * processes):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
 
 
 if __name__ == "__main__":
     configure_logging()
     command = sys.argv[1]
-    scanner = Scanner(scan_type=command)
-    scanner.run()
+    if command == "serve":
+        ScanService().serve(get_daemon_socket_path() or
+                            "/var/run/analytics-integration.sock")
+    elif command == "replay":
+        outbox = Outbox.from_env()
+        if outbox is None:
+            print ("No outbox to replay, OUTBOX_PATH is not given.")
+            sys.exit(1)
+        delivered, failed = outbox.replay()
+        print ("Replayed outbox %s: %d delivered, %d failed, %d dropped, "
+               "%d pending." % (outbox.path, delivered, failed,
+                                outbox.dropped, len(outbox)))
+        sys.exit(1 if failed else 0)
+    elif command == "bulk":
+        # integration.py bulk [file|-] [scan type]
+        path = sys.argv[2] if len(sys.argv) > 2 else "-"
+        scan_type = sys.argv[3] if len(sys.argv) > 3 else "register"
+        scanner = BulkScanner(scan_type, read_image_list(path))
+        scanner.run()
+    else:
+        scanner = Scanner(scan_type=command)
+        scanner.run()
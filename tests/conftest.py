@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+
+import pytest
+
+import benchmark
+import integration
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+@pytest.fixture(autouse=True)
+def server_state(monkeypatch):
+    """
+    Starts every test with closed circuit breakers, no server rings and
+    retries not waiting
+    """
+    integration._circuit_breakers.clear()
+    integration._server_rings.clear()
+    integration._gzip_refused.clear()
+    monkeypatch.setenv("SERVER_BACKOFF", "0.001")
+    monkeypatch.setenv("SERVER_BACKOFF_MAX", "0.001")
+    yield
+    integration._circuit_breakers.clear()
+    integration._server_rings.clear()
+
+
+@pytest.fixture
+def make_server():
+    """
+    Returns a function starting local stand-in analytics servers with
+    given options, see benchmark.FakeAnalyticsServer
+    """
+    pytest.importorskip("requests")
+    servers = []
+
+    def make_server(**kwargs):
+        servers.append(benchmark.FakeAnalyticsServer(**kwargs).start())
+        return servers[-1]
+
+    yield make_server
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def server(make_server):
+    """
+    Local stand-in analytics server
+    """
+    return make_server()
+
+
+class ScanEnv(object):
+    """
+    Scanner env for scans against a server, with the labels of containers
+    read from image configs written to configs directory
+    """
+
+    def __init__(self, path, monkeypatch):
+        self.path = path
+        self.monkeypatch = monkeypatch
+        self.configs = os.path.join(path, "image-configs")
+        os.makedirs(self.configs)
+
+    def write_config(self, container, git_sha="1" * 40):
+        """
+        Writes the image config of container, labeled with git-url
+        https://github.com/example/<container>
+        """
+        with open(os.path.join(self.configs, container + ".json"), "w") as f:
+            json.dump({"config": {"Labels": {
+                "git-url": "https://github.com/example/" + container,
+                "git-sha": git_sha,
+                "email-ids": "owner@example.com",
+            }}}, f)
+
+    def setup(self, server_url, containers=("config-image",),
+              image_name="example/config-image"):
+        """
+        Sets the scanner env up for scans of containers against server_url,
+        returns self
+        """
+        for container in containers:
+            self.write_config(container)
+        self.monkeypatch.setenv("IMAGE_NAME", image_name)
+        self.monkeypatch.setenv("SERVER", server_url)
+        self.monkeypatch.setenv("LABEL_SOURCES", "config")
+        self.monkeypatch.setenv("IMAGE_CONFIG_DIR", self.configs)
+        return self
+
+    def mount(self, containers):
+        """
+        Creates the containers under a /scanin directory and an empty
+        /scanout directory for the scanner, returns their paths
+        """
+        scanin = os.path.join(self.path, "scanin")
+        scanout = os.path.join(self.path, "scanout")
+        os.makedirs(scanin)
+        os.makedirs(scanout)
+        for container in containers:
+            os.makedirs(os.path.join(scanin, container))
+        self.monkeypatch.setattr(integration, "INDIR", scanin)
+        self.monkeypatch.setattr(integration, "OUTDIR", scanout)
+        return scanin, scanout
+
+
+@pytest.fixture
+def scan_env(tmp_path, monkeypatch):
+    """
+    Scanner env with image configs of containers, see ScanEnv
+    """
+    return ScanEnv(str(tmp_path), monkeypatch)
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.requests += 1
+        self.server.clients.add(self.client_address)
+        etag = self.server.etag
+        if etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.body
+        content_type = "text/html"
+        if body is None:
+            body = json.dumps({"status": self.server.status}).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+
+class StatusServer(ThreadingMixIn, HTTPServer):
+    # keep-alive connections of pooled session do not block shutdown
+    daemon_threads = True
+    # ETag of responses, answering matching conditional calls with 304
+    etag = None
+    # body of responses instead of JSON, e.g. an error page of a proxy
+    body = None
+
+
+@pytest.fixture
+def status_server():
+    """
+    Returns a function starting local servers answering every call with
+    given status code, counting the calls in requests
+    """
+    pytest.importorskip("requests")
+    servers = []
+
+    def status_server(status):
+        server = StatusServer(("127.0.0.1", 0), StatusHandler)
+        server.status = status
+        server.requests = 0
+        # addresses of client connections calls were made on
+        server.clients = set()
+        server.url = "http://%s:%d/" % server.server_address
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield status_server
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,32 @@
+import integration
+
+
+def send_batch(server, batch_size, bulk_api="/api/v1/register/bulk"):
+    batcher = integration.RegistrationBatcher(
+        "/api/v1/register", bulk_api, batch_size=batch_size,
+        flush_interval=60)
+    requests = [batcher.submit(server.url, "/api/v1/register",
+                               {"git-url": "https://example.com/%d" % i,
+                                "git-sha": "%040x" % i})
+                for i in range(batch_size)]
+    return batcher, [request.wait() + (request.stats,)
+                     for request in requests]
+
+
+def test_bulk_call_counted_once(server):
+    batcher, results = send_batch(server, 4)
+    assert server.requests == {"/api/v1/register/bulk": 1}
+    assert batcher.bulk_calls == 1
+    assert [status for status, _, _ in results] == [True] * 4
+    assert [resp["git-sha"] for _, resp, _ in results] == [
+        "%040x" % i for i in range(4)]
+    assert sum(stats.get("requests", 0) for _, _, stats in results) == 1
+    assert all(stats["bulk_size"] == 4 for _, _, stats in results)
+
+
+def test_falls_back_without_bulk_api(server):
+    batcher, results = send_batch(server, 3, bulk_api="/api/v1/missing")
+    assert not batcher.bulk_supported
+    assert server.requests == {"/api/v1/missing": 1, "/api/v1/register": 3}
+    assert [status for status, _, _ in results] == [True] * 3
+    assert sum(stats.get("requests", 0) for _, _, stats in results) == 4
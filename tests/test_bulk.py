@@ -0,0 +1,35 @@
+import io
+import os
+
+import integration
+
+
+def test_read_image_list(tmp_path, monkeypatch):
+    path = tmp_path / "images.txt"
+    path.write_text(u"# node images\nexample/a\n\n  example/b  \n")
+    assert integration.read_image_list(str(path)) == [
+        "example/a", "example/b"]
+
+    monkeypatch.setattr("sys.stdin", io.StringIO(u"example/c\n"))
+    assert integration.read_image_list("-") == ["example/c"]
+
+
+def test_target_containers(tmp_path, monkeypatch):
+    uuids = {"example/a": "1" * 64, "example/a:latest": "1" * 64,
+             "example/b": "2" * 64, "example/exported": "3" * 64}
+    monkeypatch.setattr(integration, "connect_local_docker_socket",
+                        lambda: None)
+    monkeypatch.setattr(integration, "get_image_uuid",
+                        lambda client, image_name: uuids[image_name])
+    monkeypatch.setattr(integration, "OUTDIR", str(tmp_path))
+    os.makedirs(str(tmp_path / ("3" * 64)))
+
+    scanner = integration.BulkScanner(
+        "register", ["example/b", "example/a", "example/a:latest",
+                     "example/missing", "example/exported"], processes=2)
+    assert scanner.target_containers() == ["1" * 64, "2" * 64]
+    assert scanner.images == {"1" * 64: "example/a", "2" * 64: "example/b"}
+    assert scanner.discovery["entries"] == 5
+    assert scanner.discovery["rejected"] == {
+        "duplicate": 1, "unresolved": 1, "exported": 1}
+    assert scanner.workers_used(["1" * 64]) == 1
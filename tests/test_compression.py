@@ -0,0 +1,85 @@
+import json
+import zlib
+
+import pytest
+
+import integration
+
+
+PAYLOAD = {"git-url": "https://github.com/example/repo",
+           "dependencies": ["package-%d" % i for i in range(500)]}
+
+
+def test_gzip_compress():
+    data = b"x" * 1000
+    compressed = integration.gzip_compress(data)
+    assert len(compressed) < len(data)
+    assert zlib.decompress(compressed, 16 + zlib.MAX_WBITS) == data
+
+
+def test_invalid_compression(monkeypatch):
+    monkeypatch.setenv("REQUEST_COMPRESSION", "brotli")
+    with pytest.raises(ValueError):
+        integration.get_request_compression()
+
+
+def test_compressed_request(monkeypatch, make_server):
+    monkeypatch.setenv("REQUEST_COMPRESSION", "gzip")
+    server = make_server(gzip=True)
+    status, _ = integration.post_request(server.url, "/api/v1/register",
+                                         PAYLOAD)
+    assert status
+    assert server.requests == {"/api/v1/register": 1}
+    assert 0 < server.bytes_received < len(json.dumps(PAYLOAD))
+
+
+def test_small_bodies_sent_uncompressed(monkeypatch, make_server):
+    monkeypatch.setenv("REQUEST_COMPRESSION", "gzip")
+    monkeypatch.setenv("REQUEST_COMPRESSION_MIN_SIZE", "100000")
+    server = make_server(gzip=True)
+    status, _ = integration.post_request(server.url, "/api/v1/register",
+                                         PAYLOAD)
+    assert status
+    assert server.bytes_received == len(json.dumps(PAYLOAD))
+
+
+def test_refused_compression_falls_back(monkeypatch, make_server):
+    monkeypatch.setenv("REQUEST_COMPRESSION", "gzip")
+    server = make_server(gzip=False)
+    status, _ = integration.post_request(server.url, "/api/v1/register",
+                                         PAYLOAD)
+    assert status
+    # answered with 415, then sent again uncompressed
+    assert server.requests == {"/api/v1/register": 2}
+    assert server.url in integration._gzip_refused
+
+    status, _ = integration.post_request(
+        server.url, "/api/v1/register", dict(PAYLOAD, **{"git-sha": "1"}))
+    assert status
+    assert server.requests == {"/api/v1/register": 3}
+
+
+def test_undecodable_response_fails_the_call(status_server):
+    server = status_server(200)
+    server.body = b"<html><body>Bad Gateway</body></html>"
+    stats = {}
+    status, error = integration.post_request(server.url, "/api/v1/register",
+                                             PAYLOAD, stats)
+    assert not status
+    assert "Could not decode JSON response" in error
+    assert stats["status_code"] == 200
+
+    status, error = integration.get_request(server.url, "/api/v1/report")
+    assert not status
+    assert "Could not decode JSON response" in error
+
+
+def test_undecodable_response_fails_the_scan(status_server, scan_env):
+    server = status_server(200)
+    server.body = b"<html><body>Bad Gateway</body></html>"
+    scan_env.setup(server.url)
+
+    scanner = integration.Scanner(scan_type="register")
+    (_, status, output, _), = scanner.scan_containers(["config-image"])
+    assert not status
+    assert output["Error Class"] == "server_error"
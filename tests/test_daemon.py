@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+import pytest
+
+import integration
+
+
+@pytest.fixture
+def daemon(tmp_path, server, scan_env):
+    scan_env.setup(server.url)
+    socket_path = str(tmp_path / "scanner.sock")
+    service = integration.ScanService(workers=2)
+    thread = threading.Thread(target=service.serve, args=(socket_path,))
+    thread.daemon = True
+    thread.start()
+    for _ in range(100):
+        if service.server is not None and os.path.exists(socket_path):
+            break
+        time.sleep(0.01)
+    yield socket_path
+    service.server.shutdown()
+    thread.join(5)
+
+
+def job(server, container="config-image"):
+    return {"scan_type": "register", "container": container,
+            "image_name": "example/config-image", "server_url": server.url}
+
+
+def test_daemon_runs_scan_jobs(daemon, server):
+    status, output = integration.request_daemon_scan(daemon, job(server),
+                                                     timeout=10)
+    assert status
+    assert output["Scan Results"]["git-url"] == (
+        "https://github.com/example/config-image")
+    assert server.requests == {"/api/v1/register": 1}
+
+
+def test_daemon_reports_failed_scans(daemon, server):
+    status, output = integration.request_daemon_scan(
+        daemon, job(server, container="missing-image"), timeout=10)
+    assert not status
+    assert output["Error Class"] == "label_source"
+    assert server.requests == {"/api/v1/scanner-error": 1}
+
+
+def test_scanner_hands_scans_over_to_daemon(daemon, server, monkeypatch):
+    monkeypatch.setenv("SCANNER_SOCKET", daemon)
+    # labels can only be read by the daemon
+    monkeypatch.setenv("IMAGE_CONFIG_DIR", "/nonexistent")
+    scanner = integration.Scanner(scan_type="register")
+    (_, status, output, _), = scanner.scan_containers(["config-image"])
+    assert status
+    assert output["Scan Results"]["git-url"] == (
+        "https://github.com/example/config-image")
@@ -0,0 +1,27 @@
+import os
+
+import integration
+
+
+def test_target_containers(scan_env):
+    scanin, scanout = scan_env.mount(["b", "a", "exported", ".hidden"])
+    open(os.path.join(scanin, "file.txt"), "w").close()
+    os.makedirs(os.path.join(scanout, "exported"))
+
+    scanner = integration.Scanner(scan_type="register", workers=3)
+    assert scanner.target_containers() == ["a", "b"]
+    assert scanner.discovery["entries"] == 5
+    assert scanner.discovery["targets"] == 2
+    assert scanner.discovery["rejected"] == {
+        "hidden": 1, "not_directory": 1, "exported": 1}
+
+
+def test_exported_containers_rescanned_with_ndjson_results(scan_env,
+                                                           monkeypatch):
+    _, scanout = scan_env.mount(["exported"])
+    os.makedirs(os.path.join(scanout, "exported"))
+    monkeypatch.setenv("RESULTS_OUTPUT", "ndjson")
+
+    scanner = integration.Scanner(scan_type="register")
+    assert scanner.target_containers() == ["exported"]
+    assert scanner.discovery["rejected"] == {}
@@ -0,0 +1,40 @@
+import pytest
+
+import integration
+
+
+def test_session_shared(monkeypatch):
+    pytest.importorskip("requests")
+    monkeypatch.setattr(integration, "_http_session", None)
+    monkeypatch.setattr(integration, "_http_session_pool_size", 0)
+    monkeypatch.setenv("SERVER_POOL_SIZE", "4")
+    session = integration.get_http_session()
+    assert integration.get_http_session() is session
+    assert integration._http_session_pool_size == 4
+
+    adapter = session.get_adapter("http://server/")
+    # pools are only ever enlarged
+    assert integration.get_http_session(pool_size=2) is session
+    assert session.get_adapter("http://server/") is adapter
+    integration.get_http_session(pool_size=8)
+    assert session.get_adapter("http://server/") is not adapter
+    assert integration._http_session_pool_size == 8
+
+
+def test_server_timeout(monkeypatch):
+    assert integration.get_server_timeout() == (5.0, 60.0)
+    monkeypatch.setenv("SERVER_CONNECT_TIMEOUT", "1")
+    monkeypatch.setenv("SERVER_READ_TIMEOUT", "2.5")
+    assert integration.get_server_timeout() == (1.0, 2.5)
+
+
+def test_connections_kept_alive(monkeypatch, status_server):
+    monkeypatch.setattr(integration, "_http_session", None)
+    monkeypatch.setattr(integration, "_http_session_pool_size", 0)
+    server = status_server(200)
+    for i in range(5):
+        status, _ = integration.post_request(
+            server.url, "/api/v1/register", {"git-url": str(i)})
+        assert status
+    assert server.requests == 5
+    assert len(server.clients) == 1
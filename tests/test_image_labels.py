@@ -0,0 +1,57 @@
+import pytest
+
+import integration
+
+
+class FakeDockerClient(object):
+
+    def __init__(self, images):
+        self.images = images
+        self.inspected = []
+
+    def inspect_image(self, image_name):
+        self.inspected.append(image_name)
+        return self.images[image_name]
+
+
+def test_image_inspected_once():
+    client = FakeDockerClient({"example/image": {
+        "Id": "sha256:" + "a" * 64,
+        "Config": {"Labels": {"git-url": "https://github.com/example/repo"}},
+    }})
+    cache = integration.ImageLabelCache()
+    for _ in range(3):
+        uuid, labels = cache.get(client, "example/image")
+        assert uuid == "a" * 64
+        assert labels == {"git-url": "https://github.com/example/repo"}
+    assert client.inspected == ["example/image"]
+
+
+def test_image_without_labels():
+    client = FakeDockerClient({"example/image": {
+        "Id": "sha256:" + "b" * 64, "Config": {"Labels": None}}})
+    assert integration.ImageLabelCache().get(client, "example/image") == (
+        "b" * 64, {})
+
+
+def test_daemon_label_source_connects_once(monkeypatch):
+    client = FakeDockerClient({"example/image": {
+        "Id": "sha256:" + "c" * 64, "Config": {"Labels": {"a": "1"}}}})
+    connects = []
+    monkeypatch.setattr(integration, "connect_local_docker_socket",
+                        lambda base_url: connects.append(base_url) or client)
+    source = integration.DaemonLabelSource()
+    for container in ("c1", "c2"):
+        assert source.get_labels("example/image", container) == (
+            "c" * 64, {"a": "1"})
+    assert connects == ["unix:///var/run/docker.sock"]
+    assert client.inspected == ["example/image"]
+
+
+def test_find_label():
+    labels = {"git-url": "https://github.com/example/repo"}
+    assert integration.find_label(labels, "example/image", "git-url") == (
+        "https://github.com/example/repo")
+    with pytest.raises(integration.EmptyLabelException):
+        integration.find_label(dict(labels, **{"git-sha": ""}),
+                               "example/image", "git-sha")
@@ -0,0 +1,91 @@
+import os
+import tarfile
+
+import pytest
+
+import integration
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "fixtures")
+SCANIN = os.path.join(FIXTURES, "scanin")
+IMAGE_CONFIGS = os.path.join(FIXTURES, "image-configs")
+
+
+class StaticLabelSource(object):
+    name = "static"
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.calls = 0
+
+    def get_labels(self, image_name, container, timings=None):
+        self.calls += 1
+        return container, self.labels
+
+
+def test_labels_from_config_file():
+    source = integration.ImageConfigLabelSource(config_dir=IMAGE_CONFIGS,
+                                                indir=SCANIN)
+    uuid, labels = source.get_labels("example/config-image", "config-image")
+    assert uuid == "config-image"
+    assert labels["git-url"] == "https://github.com/example/config-image"
+
+
+def test_labels_from_mounted_layout():
+    source = integration.ImageConfigLabelSource(indir=SCANIN)
+    uuid, labels = source.get_labels("example/layout-image", "layout-image")
+    assert uuid == "layout-image"
+    assert labels["git-url"] == "https://github.com/example/layout-image"
+
+
+def test_labels_from_tarball(tmp_path):
+    layout_dir = os.path.join(SCANIN, "layout-image")
+    with tarfile.open(str(tmp_path / "tarball-image.tar"), "w") as tarball:
+        for name in os.listdir(layout_dir):
+            tarball.add(os.path.join(layout_dir, name), arcname=name)
+    source = integration.ImageConfigLabelSource(config_dir=str(tmp_path),
+                                                indir=SCANIN)
+    uuid, labels = source.get_labels("example/layout-image", "tarball-image")
+    assert uuid == "tarball-image"
+    assert labels["git-sha"] == "89abcdef0123456789abcdef0123456789abcdef"
+
+
+@pytest.mark.parametrize("container", [
+    "missing-image",
+    # rootfs shipping its own, unrelated /manifest.json
+    "rootfs-image",
+    # image config path pointing outside of the layout
+    "escaping-image",
+])
+def test_no_labels_without_valid_layout(container):
+    source = integration.ImageConfigLabelSource(indir=SCANIN)
+    assert source.get_labels("example/image", container) is None
+
+
+def test_invalid_tarball_is_skipped(tmp_path):
+    (tmp_path / "broken-image.tar").write_bytes(b"not a tarball")
+    source = integration.ImageConfigLabelSource(config_dir=str(tmp_path),
+                                                indir=SCANIN)
+    assert source.get_labels("example/image", "broken-image") is None
+
+
+def test_falls_back_to_next_source():
+    fallback = StaticLabelSource({"git-url": "from-daemon"})
+    source = integration.LabelSource([
+        integration.ImageConfigLabelSource(indir=SCANIN), fallback])
+
+    assert source.get_labels("example/layout-image", "layout-image")[1][
+        "git-url"] == "https://github.com/example/layout-image"
+    assert fallback.calls == 0
+
+    assert source.get_labels("example/webapp", "rootfs-image") == (
+        "rootfs-image", {"git-url": "from-daemon"})
+    assert fallback.calls == 1
+
+
+def test_no_source_has_labels():
+    source = integration.LabelSource([
+        integration.ImageConfigLabelSource(indir=SCANIN)])
+    with pytest.raises(ValueError):
+        source.get_labels("example/webapp", "rootfs-image")
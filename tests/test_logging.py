@@ -0,0 +1,74 @@
+import json
+import logging
+
+import integration
+
+
+def make_record(level, msg="message", *args):
+    return logging.LogRecord("integration-scanner", level, __file__, 1, msg,
+                             args, None)
+
+
+def test_sampling_filter():
+    sampling = integration.LogSamplingFilter({logging.DEBUG: 0.0,
+                                              logging.INFO: 1.0})
+    assert not sampling.filter(make_record(logging.DEBUG))
+    assert sampling.filter(make_record(logging.INFO))
+    # levels without a rate are all passed
+    assert sampling.filter(make_record(logging.ERROR))
+    assert sampling.dropped == 1
+
+
+def test_sample_rates_from_env(monkeypatch):
+    monkeypatch.setenv("LOG_SAMPLE_DEBUG", "0.1")
+    monkeypatch.setenv("LOG_SAMPLE_INFO", "2")
+    rates = integration.get_log_sample_rates()
+    assert rates[logging.DEBUG] == 0.1
+    assert rates[logging.INFO] == 1.0
+    assert rates[logging.ERROR] == 1.0
+
+
+def test_queue_handler_drops_records_when_full():
+    records = integration.queue.Queue(1)
+    handler = integration.QueueHandler(records)
+    handler.emit(make_record(logging.INFO, "%s scanned", "image"))
+    handler.emit(make_record(logging.INFO))
+    assert handler.dropped == 1
+    record = records.get_nowait()
+    # message is formatted by emitting thread
+    assert (record.msg, record.args) == ("image scanned", None)
+
+
+def test_json_formatter_adds_log_context():
+    record = make_record(logging.WARNING, "%d failed", 2)
+    with integration.log_context(container="c1", image="example/image"):
+        integration.LogContextFilter().filter(record)
+    entry = json.loads(integration.JSONLogFormatter().format(record))
+    assert entry["level"] == "WARNING"
+    assert entry["message"] == "2 failed"
+    assert entry["container"] == "c1"
+    assert entry["image"] == "example/image"
+
+
+def test_configure_logging(monkeypatch, capsys):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    monkeypatch.setenv("LOG_STREAM", "stderr")
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    logger = integration.configure_logging("test-configure-logging")
+    try:
+        assert integration.configure_logging(
+            "test-configure-logging") is logger
+        with integration.log_context(container="c1"):
+            logger.info("scanned")
+        logger.debug("not logged")
+    finally:
+        handler, listener = integration._log_handlers.pop(
+            "test-configure-logging")
+        listener.stop()
+        logger.removeHandler(handler)
+
+    out, err = capsys.readouterr()
+    assert out == ""
+    entry, = [json.loads(line) for line in err.splitlines()]
+    assert entry["message"] == "scanned"
+    assert entry["container"] == "c1"
@@ -0,0 +1,42 @@
+import integration
+
+
+def test_previous_result(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = integration.ScanManifest(path, max_age=60)
+    manifest.record("a", "register", True, {"Label Fingerprint": "f1"})
+    manifest.record("b", "register", False, {"Label Fingerprint": "f2"})
+    manifest.save()
+
+    manifest = integration.ScanManifest(path, max_age=60)
+    output = manifest.previous_result("a", "register", "f1")
+    assert output["Incremental"]["Reused"] is True
+    assert manifest.previous_result("a", "register", "changed") is None
+    assert manifest.previous_result("a", "get_report", "f1") is None
+    # failed scans are not reused
+    assert manifest.previous_result("b", "register", "f2") is None
+
+    manifest.max_age = -1
+    assert manifest.previous_result("a", "register", "f1") is None
+
+
+def test_incremental_scan(tmp_path, monkeypatch, server, scan_env):
+    scan_env.setup(server.url, ["image-a", "image-b"],
+                   image_name="example/image")
+    monkeypatch.setenv("SCAN_MANIFEST", str(tmp_path / "manifest.json"))
+
+    def scan():
+        scanner = integration.Scanner(scan_type="register")
+        results = list(scanner.scan_containers(["image-a", "image-b"]))
+        scanner.manifest.save()
+        return dict((container, "Incremental" in output)
+                    for container, _, output, _ in results)
+
+    assert scan() == {"image-a": False, "image-b": False}
+    assert scan() == {"image-a": True, "image-b": True}
+    assert server.requests == {"/api/v1/register": 2}
+
+    # image-b labels changed since its last scan
+    scan_env.write_config("image-b", "3" * 40)
+    assert scan() == {"image-a": True, "image-b": False}
+    assert server.requests == {"/api/v1/register": 3}
@@ -0,0 +1,109 @@
+import pytest
+
+import integration
+
+
+def test_put_queues_payload_once(tmp_path):
+    outbox = integration.Outbox(str(tmp_path / "outbox.db"))
+    key = outbox.put("http://server", "/api/v1/register", {"git-url": "a"})
+    assert outbox.put("http://server", "/api/v1/register",
+                      {"git-url": "a"}) == key
+    assert len(outbox) == 1
+    assert outbox.queued == 1
+    (_, endpoint, api, data), = outbox.pending(10)
+    assert (endpoint, api, data) == (
+        "http://server", "/api/v1/register", {"git-url": "a"})
+
+
+def test_oldest_entries_dropped(tmp_path):
+    outbox = integration.Outbox(str(tmp_path / "outbox.db"), size=2)
+    for name in ("a", "b", "c"):
+        outbox.put("http://server", "/api/v1/register", {"git-url": name})
+    assert [data["git-url"] for _, _, _, data in outbox.pending(10)] == [
+        "b", "c"]
+
+
+def fill(outbox, url, count):
+    for i in range(count):
+        outbox.put(url, "/api/v1/register", {"git-url": str(i)})
+
+
+def test_replay_delivers_calls(tmp_path, status_server):
+    server = status_server(200)
+    outbox = integration.Outbox(str(tmp_path / "outbox.db"), batch_size=2)
+    fill(outbox, server.url, 3)
+    assert outbox.replay() == (3, 0)
+    assert len(outbox) == 0
+    assert server.requests == 3
+
+
+def test_replay_drops_rejected_calls(tmp_path, status_server):
+    server = status_server(400)
+    outbox = integration.Outbox(str(tmp_path / "outbox.db"), batch_size=2)
+    fill(outbox, server.url, 3)
+    # calls rejected with 4xx would be rejected on every replay
+    assert outbox.replay() == (0, 0)
+    assert len(outbox) == 0
+    assert outbox.dropped == 3
+    assert server.requests == 3
+
+
+@pytest.mark.parametrize("status_code, retryable", [
+    (None, True),
+    (500, True),
+    (503, True),
+    (408, True),
+    (429, True),
+    (400, False),
+    (404, False),
+    (409, False),
+])
+def test_retryable(status_code, retryable):
+    assert integration.Outbox.retryable(status_code) is retryable
+
+
+@pytest.mark.parametrize("status_code", [503, 429])
+def test_replay_stops_while_server_fails(tmp_path, monkeypatch,
+                                         status_server, status_code):
+    monkeypatch.setenv("SERVER_RETRIES", "0")
+    server = status_server(status_code)
+    outbox = integration.Outbox(str(tmp_path / "outbox.db"))
+    fill(outbox, server.url, 3)
+    assert outbox.replay() == (0, 1)
+    assert len(outbox) == 3
+    assert server.requests == 1
+
+
+def test_undelivered_scan_calls_queued(tmp_path, monkeypatch, status_server,
+                                       scan_env):
+    server = status_server(503)
+    monkeypatch.setenv("SERVER_RETRIES", "0")
+    scan_env.setup(server.url)
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path / "outbox.db"))
+
+    scanner = integration.Scanner(scan_type="register")
+    (_, status, output, _), = scanner.scan_containers(["config-image"])
+    assert not status
+    assert output["Server Requests"]["queued"] == 2
+    assert sorted(api for _, _, api, _ in scanner.outbox.pending(10)) == [
+        "/api/v1/register", "/api/v1/scanner-error"]
+
+    # server is back
+    server.status = 200
+    assert scanner.outbox.replay() == (2, 0)
+    assert len(scanner.outbox) == 0
+
+
+def test_rejected_scan_calls_not_queued(tmp_path, monkeypatch,
+                                        status_server, scan_env):
+    server = status_server(400)
+    scan_env.setup(server.url)
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path / "outbox.db"))
+
+    scanner = integration.Scanner(scan_type="register")
+    (_, status, output, _), = scanner.scan_containers(["config-image"])
+    assert not status
+    assert output["Error Class"] == "server_error"
+    assert output["Server Requests"]["status_code"] == 400
+    assert "queued" not in output["Server Requests"]
+    assert len(scanner.outbox) == 0
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import integration
+
+
+@pytest.fixture
+def containers(monkeypatch, make_server, scan_env):
+    containers = ["image-%02d" % i for i in range(12)]
+    server = make_server(latency=0.01)
+    # image-05 has no image config
+    scan_env.setup(server.url, [c for c in containers if c != "image-05"],
+                   image_name="example/image")
+    monkeypatch.setattr(integration, "_http_session", None)
+    monkeypatch.setattr(integration, "_http_session_pool_size", 0)
+    monkeypatch.setenv("SCAN_ENGINE", "pipeline")
+    return server, containers
+
+
+def test_pipelined_scans_in_order(containers):
+    server, containers = containers
+    scanner = integration.Scanner(scan_type="register", workers=2)
+    results = list(scanner.scan_containers(containers))
+    assert [container for container, _, _, _ in results] == containers
+    for container, status, output, _ in results:
+        if container == "image-05":
+            assert not status
+            assert output["Error Class"] == "label_source"
+        else:
+            assert status
+            assert output["Scan Results"]["git-url"].endswith(container)
+    assert server.requests == {"/api/v1/register": 11,
+                               "/api/v1/scanner-error": 1}
+
+
+def test_session_pooled_for_server_calls_in_flight(containers, monkeypatch):
+    _, containers = containers
+    monkeypatch.setenv("SCAN_CONCURRENCY", "20")
+    scanner = integration.Scanner(scan_type="register", workers=2)
+    list(scanner.scan_containers(containers))
+    # as many connections as server calls in flight, up to the containers
+    assert integration._http_session_pool_size == len(containers)
+
+
+class CountingLabelSource(object):
+
+    def __init__(self, source):
+        self.source = source
+        self.calls = 0
+
+    def get_labels(self, image_name, container, timings=None):
+        self.calls += 1
+        return self.source.get_labels(image_name, container, timings)
+
+
+def test_pipeline_runs_bounded_ahead(containers, monkeypatch):
+    _, containers = containers
+    monkeypatch.setenv("SCAN_CONCURRENCY", "2")
+    scanner = integration.Scanner(scan_type="register", workers=1)
+    scanner.label_source = CountingLabelSource(scanner.label_source)
+    results = scanner.scan_containers(containers)
+    next(results)
+    # consumer is busy, e.g. exporting the result
+    time.sleep(0.2)
+    # the result consumed, 2 scans in flight and 2 label fetches ahead
+    assert scanner.label_source.calls <= 5
+    assert [result[0] for result in results] == containers[1:]
+    assert scanner.label_source.calls == len(containers)
+
+
+def test_invalid_engine(monkeypatch):
+    monkeypatch.setenv("SCAN_ENGINE", "asyncio")
+    with pytest.raises(ValueError):
+        integration.Scanner(scan_type="register")
@@ -0,0 +1,41 @@
+import integration
+
+
+def test_take():
+    bucket = integration.TokenBucket(rate=10, burst=2)
+    assert bucket.take(2, 0.0, 0.0) == (1, 0.0)
+    tokens, wait = bucket.take(0, 0.0, 0.05)
+    assert round(tokens, 6) == 0.5
+    assert round(wait, 6) == 0.05
+    # bucket does not fill over burst
+    assert bucket.take(0, 0.0, 60.0) == (1, 0.0)
+
+
+def test_acquire_waits_beyond_burst():
+    bucket = integration.TokenBucket(rate=100, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() > 0
+
+
+def test_file_bucket_shared(tmp_path):
+    path = str(tmp_path / "bucket.json")
+    first = integration.FileTokenBucket(path, rate=100, burst=2)
+    second = integration.FileTokenBucket(path, rate=100, burst=2)
+    assert first.acquire() == 0.0
+    assert first.acquire() == 0.0
+    assert second.acquire() > 0
+
+
+def test_server_calls_rate_limited(monkeypatch, status_server):
+    monkeypatch.setattr(integration, "_rate_limiter", None)
+    monkeypatch.setenv("RATE_LIMIT", "100")
+    monkeypatch.setenv("RATE_BURST", "1")
+    server = status_server(200)
+    stats = {}
+    for i in range(3):
+        status, _ = integration.post_request(
+            server.url, "/api/v1/register", {"git-url": str(i)}, stats)
+        assert status
+    assert server.requests == 3
+    assert stats["rate_limited_seconds"] > 0
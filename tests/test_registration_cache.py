@@ -0,0 +1,49 @@
+import time
+
+import integration
+
+
+def test_get_put(tmp_path):
+    cache = integration.RegistrationCache(str(tmp_path / "cache.db"))
+    assert cache.get("https://example.com/repo", "1" * 40) is None
+    cache.put("https://example.com/repo", "1" * 40, {"status": "ok"})
+    assert cache.get("https://example.com/repo", "1" * 40) == {
+        "status": "ok"}
+    assert cache.get("https://example.com/repo", "2" * 40) is None
+    assert cache.stats() == {"hits": 1, "misses": 2}
+
+
+def test_entries_expire(tmp_path):
+    cache = integration.RegistrationCache(str(tmp_path / "cache.db"),
+                                          ttl=0)
+    cache.put("https://example.com/repo", "1" * 40, {"status": "ok"})
+    time.sleep(0.01)
+    assert cache.get("https://example.com/repo", "1" * 40) is None
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = integration.RegistrationCache(str(tmp_path / "cache.db"),
+                                          size=2)
+    cache.put("a", "1", {"name": "a"})
+    time.sleep(0.01)
+    cache.put("b", "1", {"name": "b"})
+    time.sleep(0.01)
+    assert cache.get("a", "1") is not None
+    time.sleep(0.01)
+    cache.put("c", "1", {"name": "c"})
+    assert cache.get("a", "1") is not None
+    assert cache.get("b", "1") is None
+    assert cache.get("c", "1") is not None
+
+
+def test_registrations_served_from_cache(tmp_path, monkeypatch, server,
+                                         scan_env):
+    scan_env.setup(server.url)
+    monkeypatch.setenv("REGISTRATION_CACHE", str(tmp_path / "cache.db"))
+
+    for hit in (False, True):
+        scanner = integration.Scanner(scan_type="register")
+        (_, status, output, _), = scanner.scan_containers(["config-image"])
+        assert status
+        assert output["Scan Results"]["registration_cache"]["hit"] is hit
+    assert server.requests == {"/api/v1/register": 1}
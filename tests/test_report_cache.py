@@ -0,0 +1,58 @@
+import integration
+
+
+def test_validators_of_cached_response(tmp_path, status_server):
+    server = status_server(200)
+    server.etag = '"v1"'
+    cache = integration.ReportCache(str(tmp_path / "reports"))
+    key = cache.key(server.url + "api/v1/report", {"git-url": "a"})
+    assert cache.validators(key) == {}
+
+    status, data = integration.get_request(
+        server.url, "/api/v1/report", params={"git-url": "a"}, cache=cache)
+    assert status
+    assert data == {"status": 200}
+    assert cache.validators(key) == {"If-None-Match": '"v1"'}
+    assert cache.load(key) == data
+
+
+def test_conditional_get(tmp_path, status_server):
+    server = status_server(200)
+    server.etag = '"v1"'
+    cache = integration.ReportCache(str(tmp_path / "reports"))
+
+    def get():
+        stats = {}
+        status, data = integration.get_request(
+            server.url, "/api/v1/report", params={"git-url": "a"},
+            stats=stats, cache=cache)
+        assert status
+        return data, stats.get("not_modified", 0)
+
+    assert get() == ({"status": 200}, 0)
+    # unchanged report is answered with 304, from the cache
+    assert get() == ({"status": 200}, 1)
+
+    server.etag = '"v2"'
+    assert get() == ({"status": 200}, 0)
+    assert server.requests == 3
+    key = cache.key(server.url + "api/v1/report", {"git-url": "a"})
+    assert cache.validators(key) == {"If-None-Match": '"v2"'}
+
+
+def test_get_without_cache(status_server):
+    server = status_server(200)
+    server.etag = '"v1"'
+    for _ in range(2):
+        assert integration.get_request(server.url, "/api/v1/report") == (
+            True, {"status": 200})
+
+
+def test_get_fails_on_error_status(status_server):
+    server = status_server(404)
+    stats = {}
+    status, error = integration.get_request(server.url, "/api/v1/report",
+                                            stats=stats)
+    assert not status
+    assert "404" in error
+    assert stats["status_code"] == 404
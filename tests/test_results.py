@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from datetime import datetime
+
+import pytest
+
+import integration
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def scan_record():
+    record = integration.ScanRecord(
+        "scanner-analytics-integration", "register", "a" * 64,
+        start_time=datetime(2018, 3, 1, 9, 47, 21, 795242))
+    record["Finished Time"] = datetime(2018, 3, 1, 9, 47, 22, 13)
+    record["Successful"] = True
+    record["Scan Results"] = {
+        "git-url": "https://github.com/example/repo",
+        "last_scan_report": {"dependencies": [
+            {"package": "requests", "version": "2.18.4", "cves": []},
+            {"package": "jinja2", "version": "2.10",
+             "cves": ["CVE-2019-10906"]},
+        ]},
+        "score": 7.5,
+        "unicode": u"caf\u00e9",
+    }
+    record["Summary"] = "Last scan report available in 'Scan Results' field."
+    record["Label Fingerprint"] = "f" * 64
+    record["Server Requests"] = {"requests": 2, "retries": 1,
+                                 "circuit_breaker": "closed"}
+    record["Phase Timings"] = {"label_source.config": 0.001,
+                               "server_request": 0.25}
+    return record
+
+
+def test_scan_record_to_dict():
+    output = scan_record().to_dict()
+    assert list(output)[:3] == ["Start Time", "Finished Time", "Successful"]
+    assert output["Start Time"] == "2018-03-01-09-47-21-795242"
+    # fields not set are left out
+    assert "Error Class" not in output
+
+
+def test_scan_record_round_trip():
+    record = scan_record()
+    restored = integration.ScanRecord.from_dict(record.to_dict())
+    for name, _ in integration.ScanRecord.fields:
+        assert restored[name] == record[name]
+    assert restored.to_dict() == record.to_dict()
+
+
+def test_scan_record_from_dict_ignores_unknown_fields():
+    output = scan_record().to_dict()
+    output["Unknown Field"] = 1
+    restored = integration.ScanRecord.from_dict(output)
+    assert "Unknown Field" not in restored.to_dict()
+
+
+@pytest.mark.parametrize("output_format", [
+    "pretty",
+    "compact",
+    pytest.param("msgpack", marks=pytest.mark.skipif(
+        msgpack is None, reason="msgpack is not installed")),
+])
+def test_serialize_round_trip(output_format):
+    output = scan_record().to_dict()
+    data = integration.serialize_result(output, output_format)
+    assert isinstance(data, bytes)
+    restored = integration.deserialize_result(data, output_format)
+    assert isinstance(restored, OrderedDict)
+    assert restored == output
+    assert list(restored) == list(output)
+    assert integration.ScanRecord.from_dict(restored).to_dict() == output
+
+
+def test_serialize_formats():
+    output = scan_record().to_dict()
+    pretty = integration.serialize_result(output, "pretty")
+    compact = integration.serialize_result(output, "compact")
+    assert b"\n    " in pretty
+    assert b"\n" not in compact
+    assert len(compact) < len(pretty)
@@ -0,0 +1,69 @@
+import json
+import os
+
+import integration
+
+
+def test_sink_writes_one_record_per_line(tmp_path):
+    path = str(tmp_path / "results.ndjson")
+    sink = integration.NDJSONResultSink(path, fsync_interval=2)
+    for i in range(3):
+        sink.write({"container": str(i), "Successful": True})
+    sink.close()
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record["container"] for record in records] == ["0", "1", "2"]
+
+    # records are appended to existing results
+    sink = integration.NDJSONResultSink(path)
+    sink.write({"container": "3"})
+    sink.close()
+    with open(path) as f:
+        assert len(f.readlines()) == 4
+
+
+def scan_run(scan_env, monkeypatch, server, results_output, ndjson_path,
+             log=False):
+    _, scanout = scan_env.setup(server.url).mount(["config-image"])
+    monkeypatch.setenv("RESULTS_OUTPUT", results_output)
+    monkeypatch.setenv("RESULTS_NDJSON_PATH", ndjson_path)
+    if not log:
+        assert integration.Scanner(scan_type="register").run()
+        return scanout
+
+    # configured as the scanner command does, records are written out once
+    # the listener is stopped
+    logger = integration.configure_logging()
+    try:
+        assert integration.Scanner(scan_type="register").run()
+    finally:
+        handler, listener = integration._log_handlers.pop(logger.name)
+        listener.stop()
+        logger.removeHandler(handler)
+    return scanout
+
+
+def test_ndjson_on_stdout(scan_env, monkeypatch, capsys, server):
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    scanout = scan_run(scan_env, monkeypatch, server, "ndjson", "-",
+                       log=True)
+    out, err = capsys.readouterr()
+    # status lines and logs go to stderr, keeping stdout for records alone
+    record, = [json.loads(line) for line in out.splitlines()]
+    assert record["Successful"] is True
+    assert "Scanner execution status: True" in err
+    assert "Scanned config-image in" in err
+    assert os.listdir(scanout) == []
+
+
+def test_ndjson_and_directory(tmp_path, scan_env, monkeypatch, capsys,
+                              server):
+    ndjson_path = str(tmp_path / "results.ndjson")
+    scanout = scan_run(scan_env, monkeypatch, server, "both", ndjson_path)
+    out, _ = capsys.readouterr()
+    assert "Scanner execution status: True" in out
+    with open(ndjson_path) as f:
+        record, = [json.loads(line) for line in f]
+    with open(os.path.join(scanout, "config-image",
+                           "analytics_scanner_results.json")) as f:
+        assert json.load(f) == record
@@ -0,0 +1,75 @@
+import time
+
+import integration
+
+
+def test_circuit_breaker():
+    breaker = integration.CircuitBreaker(failure_threshold=2,
+                                         reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.allow()
+    assert breaker.is_open()
+
+    time.sleep(0.06)
+    # a single trial call is let through
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_retry_delay():
+    policy = integration.RetryPolicy(retries=3, backoff=0.5, backoff_max=2.0)
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= min(2.0, 0.5 * 2 ** attempt)
+    assert policy.delay(0, "1") == 1.0
+    assert policy.delay(0, "120") == 2.0
+    assert integration.parse_retry_after("invalid") is None
+
+
+def test_retries_exhausted_fail_the_call(monkeypatch, status_server):
+    monkeypatch.setenv("SERVER_RETRIES", "2")
+    server = status_server(503)
+    stats = {}
+    status, error = integration.post_request(server.url, "/api/v1/register",
+                                             {"git-url": "a"}, stats)
+    assert not status
+    assert "503" in error
+    assert server.requests == 3
+    assert stats["requests"] == 3
+    assert stats["retries"] == 2
+    assert stats["status_code"] == 503
+
+
+def test_server_errors_open_breaker(monkeypatch, status_server):
+    monkeypatch.setenv("BREAKER_THRESHOLD", "3")
+    server = status_server(500)
+    for i in range(5):
+        stats = {}
+        status, _ = integration.post_request(
+            server.url, "/api/v1/register", {"git-url": str(i)}, stats)
+        assert not status
+    # 500 is not retried, calls after the third are short-circuited
+    assert server.requests == 3
+    assert stats["circuit_breaker"] == "open"
+    assert "requests" not in stats
+
+
+def test_client_errors_do_not_open_breaker(monkeypatch, status_server):
+    monkeypatch.setenv("BREAKER_THRESHOLD", "2")
+    server = status_server(400)
+    for i in range(3):
+        status, _ = integration.post_request(
+            server.url, "/api/v1/register", {"git-url": str(i)})
+        assert not status
+    assert server.requests == 3
+    assert integration.get_circuit_breaker(server.url).state == "closed"
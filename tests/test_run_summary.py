@@ -0,0 +1,63 @@
+import json
+
+import integration
+
+
+def scan_output(**fields):
+    output = {
+        "Successful": True,
+        "Scan Results": {"registration_cache": {"hit": False}},
+        "Server Requests": {"requests": 2, "retries": 1},
+        "Phase Timings": {"server_request": 0.2, "label_source.config": 0.01},
+    }
+    output.update(fields)
+    return output
+
+
+def test_observe_aggregates_scans(tmp_path):
+    summary = integration.RunSummary(str(tmp_path / "summary.json"),
+                                     slowest=2)
+    summary.observe("a", True, scan_output(), 0.3, bytes_written=100)
+    summary.observe("b", True, scan_output(), 0.5, bytes_written=100)
+    summary.observe("c", False, scan_output(**{
+        "Successful": False, "Error Class": "server_error",
+        "Phase Timings": {"error_report": 0.02}}), 0.1)
+
+    result = summary.to_dict()
+    assert result["Containers"] == 3
+    assert result["Successful"] == 2
+    assert result["Errors"] == {"server_error": 1}
+    assert result["Bytes Written"] == 200
+    assert result["Server Requests"]["requests"] == 6
+    assert result["Server Requests"]["retries"] == 3
+    latency = result["Server Latency"]
+    assert latency["count"] == 3
+    assert latency["buckets"]["0.25"] == 2
+    assert latency["buckets"]["0.025"] == 1
+    assert result["Registration Cache"]["lookups"] == 3
+    assert [entry["container"] for entry in result["Slowest"]] == ["b", "a"]
+
+
+def test_reused_results_do_not_count_server_calls(tmp_path):
+    summary = integration.RunSummary(str(tmp_path / "summary.json"))
+    summary.observe("a", True, scan_output(), 0.3)
+    summary.observe("b", True, scan_output(Incremental={"Reused": True}),
+                    0.0)
+
+    result = summary.to_dict()
+    assert result["Containers"] == 2
+    assert result["Incremental"]["reused"] == 1
+    assert result["Server Requests"]["requests"] == 2
+    assert result["Server Latency"]["count"] == 1
+    assert result["Registration Cache"]["lookups"] == 1
+
+
+def test_write(tmp_path):
+    path = tmp_path / "summary.json"
+    summary = integration.RunSummary(str(path))
+    summary.observe("a", True, scan_output(), 0.3)
+    summary.write(discovery={"entries": 1, "targets": 1})
+    with open(str(path)) as f:
+        result = json.load(f)
+    assert result["Containers"] == 1
+    assert result["Discovery"]["targets"] == 1
@@ -0,0 +1,97 @@
+import socket
+
+import integration
+
+
+ENDPOINTS = ["http://a/", "http://b/", "http://c/"]
+KEYS = ["https://github.com/example/repo-%d" % i for i in range(200)]
+
+
+def test_route_is_stable():
+    ring = integration.ServerRing(ENDPOINTS)
+    routes = dict((key, ring.route(key)) for key in KEYS)
+    assert routes == dict((key, integration.ServerRing(ENDPOINTS).route(key))
+                          for key in KEYS)
+    for order in routes.values():
+        assert sorted(order) == ENDPOINTS
+    # keys are spread over all end points
+    assert set(order[0] for order in routes.values()) == set(ENDPOINTS)
+
+
+def test_removed_endpoint_moves_only_its_keys():
+    before = integration.ServerRing(ENDPOINTS)
+    after = integration.ServerRing(ENDPOINTS[:2])
+    for key in KEYS:
+        if before.route(key)[0] != ENDPOINTS[2]:
+            assert after.route(key)[0] == before.route(key)[0]
+
+
+def test_unavailable_endpoints_tried_last():
+    ring = integration.ServerRing(ENDPOINTS, slow_latency=1.0)
+    key = KEYS[0]
+    first, second, third = ring.route(key)
+
+    ring.stats[first]["healthy"] = False
+    assert ring.route(key) == [second, third, first]
+
+    ring.record(second, 2.0, True)
+    assert ring.to_dict()[second]["slow"]
+    assert ring.route(key) == [third, first, second]
+
+
+def routed_to(server_url, endpoint):
+    """
+    Returns a routing key of server_url routed to endpoint first
+    """
+    ring = integration.get_server_ring(server_url)
+    return next(key for key in KEYS if ring.route(key)[0] == endpoint)
+
+
+def test_calls_fail_over_to_next_replica(status_server):
+    failing, working = status_server(503), status_server(200)
+    server_url = "%s,%s" % (failing.url, working.url)
+    key = routed_to(server_url, failing.url)
+
+    stats = {}
+    status, _ = integration.post_request(server_url, "/api/v1/register",
+                                         {"git-url": key}, stats)
+    assert status
+    # failed over right away, without retrying the failing replica
+    assert stats["failovers"] == 1
+    assert stats.get("retries", 0) == 0
+    assert stats["endpoint"] == working.url
+    assert (failing.requests, working.requests) == (1, 1)
+    ring_stats = integration.server_ring_stats()
+    assert ring_stats[failing.url]["failures"] == 1
+    assert ring_stats[failing.url]["failovers"] == 1
+    assert ring_stats[working.url]["failures"] == 0
+
+
+def test_refused_calls_fail_over(status_server):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    refusing = "http://%s:%d/" % sock.getsockname()
+    sock.close()
+    working = status_server(200)
+    server_url = "%s,%s" % (refusing, working.url)
+
+    stats = {}
+    status, _ = integration.post_request(
+        server_url, "/api/v1/register",
+        {"git-url": routed_to(server_url, refusing)}, stats)
+    assert status
+    assert stats["requests"] == 2
+    assert stats["endpoint"] == working.url
+
+
+def test_last_replica_retried(status_server):
+    first, last = status_server(503), status_server(503)
+    server_url = "%s,%s" % (first.url, last.url)
+
+    stats = {}
+    status, _ = integration.post_request(
+        server_url, "/api/v1/register",
+        {"git-url": routed_to(server_url, first.url)}, stats)
+    assert not status
+    assert (first.requests, last.requests) == (1, 4)
+    assert stats["retries"] == 3
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+import integration
+
+
+def test_concurrent_calls_share_one_call():
+    flight = integration.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return True, {"status": "ok", "results": [1, 2]}
+
+    results = {}
+
+    def caller(name):
+        stats = {}
+        status, resp = flight.do("key", call, stats)
+        # callers modify the response they got
+        resp["results"].append(name)
+        results[name] = (status, resp, stats)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(4)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()["coalesced"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 4, "coalesced": 3}
+    for name, (status, resp, stats) in results.items():
+        assert status
+        assert resp["results"] == [1, 2, name]
+    assert results[0][2] == {"coalesced_callers": 3}
+    assert all(results[i][2]["coalesced"] == 1 for i in range(1, 4))
+
+
+def test_later_calls_start_a_new_call():
+    flight = integration.SingleFlight()
+    calls = []
+
+    def call():
+        calls.append(1)
+        return True, {"count": len(calls)}
+
+    assert flight.do("key", call) == (True, {"count": 1})
+    assert flight.do("key", call) == (True, {"count": 2})
+    assert flight.stats() == {"calls": 2, "coalesced": 0}
+
+
+def test_key_released_after_failed_call():
+    flight = integration.SingleFlight()
+
+    def call():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", call)
+    assert flight.do("key", lambda: (True, "")) == (True, "")
@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+import benchmark
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_fail_fast_imports_no_heavy_modules():
+    env = dict(os.environ)
+    env.pop("IMAGE_NAME", None)
+    env.pop("SERVER", None)
+    process = subprocess.Popen(
+        [sys.executable, "-c", benchmark.STARTUP_CODE], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=REPO_DIR)
+    stdout, stderr = process.communicate()
+    assert process.returncode == 0, stderr.decode("utf-8")
+    out = json.loads(stdout.decode("utf-8").strip().splitlines()[-1])
+    assert out["modules"] == []
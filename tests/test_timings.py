@@ -0,0 +1,29 @@
+import sys
+import time
+
+import pytest
+
+import integration
+
+
+def test_phase_timings():
+    timings = integration.PhaseTimings()
+    with timings.phase("server_request"):
+        time.sleep(0.01)
+    timings.add("server_request", 0.5)
+    assert 0.51 <= timings.to_dict()["server_request"] < 1.0
+
+
+@pytest.mark.skipif(not hasattr(time, "monotonic"),
+                    reason="compares with time.monotonic")
+def test_monotonic_clock_without_time_monotonic(monkeypatch):
+    monotonic = time.monotonic
+    monkeypatch.delattr(time, "monotonic")
+    clock = integration.get_monotonic_clock()
+    before, now, after = monotonic(), clock(), monotonic()
+    if sys.platform.startswith("linux"):
+        # same clock as time.monotonic
+        assert before <= now <= after
+    start = clock()
+    time.sleep(0.05)
+    assert clock() - start >= 0.04
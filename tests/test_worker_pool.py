@@ -0,0 +1,54 @@
+import threading
+import time
+
+import integration
+
+
+def test_bounded_imap_keeps_order():
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(4)
+    try:
+        results = integration.bounded_imap(
+            pool, lambda i: time.sleep(0.01 * (5 - i)) or i, range(6), 3)
+        assert list(results) == list(range(6))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def test_map_runs_up_to_workers_calls():
+    scanner = integration.Scanner(scan_type="register", workers=3)
+    lock = threading.Lock()
+    running = [0]
+    most = [0]
+
+    def scan(i):
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        # later items finish first
+        time.sleep(0.005 * (10 - i))
+        with lock:
+            running[0] -= 1
+        return i * 2
+
+    assert list(scanner.map(scan, list(range(10)))) == [
+        i * 2 for i in range(10)]
+    assert 1 < most[0] <= 3
+
+
+def test_map_single_worker_runs_inline():
+    scanner = integration.Scanner(scan_type="register", workers=1)
+    threads = set()
+
+    def scan(i):
+        threads.add(threading.current_thread().name)
+        return i
+
+    assert list(scanner.map(scan, [1, 2, 3])) == [1, 2, 3]
+    assert threads == set([threading.current_thread().name])
+
+
+def test_scan_workers_from_env(monkeypatch):
+    monkeypatch.setenv("SCAN_WORKERS", "3")
+    assert integration.Scanner(scan_type="register").workers == 3